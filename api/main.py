@@ -48,7 +48,13 @@ init_db()
 
 # Load config and initialize services
 config = load_config()
-retrieval_service = RetrievalService(config)
+# Query-embedding coalescing only pays off here, where many request threads embed at once.
+# The override only builds the API's own RetrievalService - tasks get the unmodified config.
+api_retrieval_config = {**config, 'embedding': {
+    **config['embedding'],
+    'query_batch_wait_ms': config['embedding'].get('api_query_batch_wait_ms', 0)
+}}
+retrieval_service = RetrievalService(api_retrieval_config)
 generation_service = GenerationService(config)
 
 # Request/Response Models
@@ -139,6 +145,7 @@ class QueryStatusResponse(BaseModel):
     progress: int = Field(..., description="Progress percentage (0-100)", ge=0, le=100)
     message: Optional[str] = Field(None, description="Current stage message")
     answer: Optional[str] = Field(None, description="Generated answer (only when SUCCESS)")
+    partial_answer: Optional[str] = Field(None, description="Answer text streamed so far (while PROCESSING)")
     sources: Optional[List[Source]] = Field(None, description="Source documents (only when SUCCESS)")
     metrics: Optional[dict] = Field(None, description="Performance metrics (only when SUCCESS)")
     error: Optional[str] = Field(None, description="Error message (only when FAILURE)")
@@ -378,7 +385,8 @@ async def query_status(task_id: str):
                 task_id=task_id,
                 status="PROCESSING",
                 progress=meta.get('progress', 0),
-                message=meta.get('message', 'Processing...')
+                message=meta.get('message', 'Processing...'),
+                partial_answer=meta.get('partial')
             )
         
         elif result.state == 'SUCCESS':
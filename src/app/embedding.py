@@ -5,6 +5,10 @@ Purpose: Convert text chunks into vector embeddings using Google Generative AI.
 
 import logging
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.embeddings import Embeddings
 from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, GoogleAPICallError
@@ -18,17 +22,99 @@ from tenacity import (
 
 logger = logging.getLogger('app_logger')
 
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent embed_queries calls (API worker threads, batch retrieval) into
+    one batched embedding request: the first caller waits up to max_wait_ms for others
+    to join, or until max_batch texts are queued. Batches are sent from a small pool so
+    a slow request doesn't hold back the next window. A caller whose batch hasn't come
+    back within timeout seconds embeds its own texts directly.
+    """
+    def __init__(self, embed_many, max_batch=100, max_wait_ms=10, max_in_flight=4, timeout=30):
+        self._embed_many = embed_many
+        self._timeout = timeout
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+        self._max_in_flight = max_in_flight
+        self._queue = queue.Queue()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((list(texts), future))
+        try:
+            return future.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Batched query embedding exceeded {self._timeout}s - embedding directly")
+            return self._embed_many(list(texts))
+
+    def _ensure_started(self):
+        # Started lazily so a forked worker process gets its own collector thread
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_in_flight, thread_name_prefix="embed-batch")
+                    threading.Thread(target=self._collect, name="embed-collector", daemon=True).start()
+
+    def _collect(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self._max_wait
+            while size < self._max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._executor.submit(self._flush, pending)
+
+    def _flush(self, pending):
+        texts = [text for batch, _ in pending for text in batch]
+        try:
+            vectors = self._embed_many(texts)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        start = 0
+        for batch, future in pending:
+            future.set_result(vectors[start:start + len(batch)])
+            start += len(batch)
+
+
 class RetryEmbeddingWrapper(Embeddings):
-    def __init__(self, model, retry_decorator):
+    def __init__(self, model, retry_decorator, query_batch_wait_ms=0, query_batch_timeout=30):
         self.model = model
         self.retry_decorator = retry_decorator
+        # Optional cross-request coalescing of query embeddings (0 = call straight through)
+        self._query_batcher = (
+            QueryEmbeddingBatcher(self._embed_queries_now, max_wait_ms=query_batch_wait_ms,
+                                  timeout=query_batch_timeout)
+            if query_batch_wait_ms > 0 else None
+        )
 
-    def embed_documents(self, texts):
-        return self.retry_decorator(self.model.embed_documents)(texts)
+    def embed_documents(self, texts, **kwargs):
+        return self.retry_decorator(self.model.embed_documents)(texts, **kwargs)
 
     def embed_query(self, text):
         return self.retry_decorator(self.model.embed_query)(text)
 
+    def embed_queries(self, texts):
+        """Embeds several queries in one batched request (query task type, not document)."""
+        if self._query_batcher is not None:
+            return self._query_batcher.embed(texts)
+        return self._embed_queries_now(texts)
+
+    def _embed_queries_now(self, texts):
+        return self.retry_decorator(self.model.embed_documents)(texts, task_type="RETRIEVAL_QUERY")
+
 
 class EmbeddingService:
     def __init__(self, config):
@@ -52,7 +138,12 @@ class EmbeddingService:
                 before_sleep=before_sleep_log(logger, logging.WARNING)
             )
             
-            self.model = RetryEmbeddingWrapper(base_model, retry_decorator)
+            self.model = RetryEmbeddingWrapper(
+                base_model,
+                retry_decorator,
+                query_batch_wait_ms=self.config['embedding'].get('query_batch_wait_ms', 0),
+                query_batch_timeout=self.config['embedding'].get('query_batch_timeout_seconds', 30)
+            )
             
             logger.info("✅ Exponential Backoff (Retry) added to Embedding Service via Wrapper.")
         except Exception as e:
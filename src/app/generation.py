@@ -3,18 +3,37 @@ Module: Generation
 Purpose: LLM interaction and answer generation using Gemini 1.5/2.0 Flash.
 """
 
+import os
 import logging
-from langchain_google_genai import ChatGoogleGenerativeAI
+from operator import itemgetter
+from src.core.llm import get_chat_model
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableParallel, RunnableLambda
 
 logger = logging.getLogger('app_logger')
 
+# Only the most recent turns go into the prompt - keeps prompt size bounded
+HISTORY_WINDOW = 8
+
+# Prompts that reason before answering put the user-facing answer after this marker
+ANSWER_SEPARATOR = "### ANSWER ###"
+
+def _format_history(msgs, k=HISTORY_WINDOW):
+    """Formats the last k chat messages as 'type: content' lines"""
+    if not msgs:
+        return ""
+    return "\n".join(f"{msg.type}: {msg.content}" for msg in msgs[-k:])
+
+def _normalize_source(src):
+    """Collapses path variants of the same file ('/a/x.pdf', 'b\\x.pdf') to the filename"""
+    return os.path.basename(str(src).replace("\\", "/")) or str(src)
+
 class GenerationService:
     def __init__(self, config):
         self.config = config
+        self.history_window = config['llm'].get('history_window', HISTORY_WINDOW)
         self._initialize_llm()
         self._build_chain()
         self._build_expansion_chain()
@@ -22,11 +41,11 @@ class GenerationService:
     def _initialize_llm(self):
         model_name = self.config['llm']['model_name']
         logger.info(f"🤖 Initializing LLM: {model_name}")
-        self.llm = ChatGoogleGenerativeAI(
-            model=model_name,
-            temperature=self.config['llm']['temperature'],
-            max_tokens=self.config['llm']['max_tokens'],
-            convert_system_message_to_human=False # Disable conversion to use native System Instructions
+        # Shared per process - keeps the Gemini connection warm across services/tasks
+        self.llm = get_chat_model(
+            model_name,
+            self.config['llm']['temperature'],
+            self.config['llm']['max_tokens']
         )
 
     def _build_chain(self):
@@ -115,12 +134,15 @@ class GenerationService:
             ("human", "Original Query: {original_user_query}") 
         ])
         
+        # Built once; itemgetter is a C-level callable (cheaper than a lambda per key)
+        self.prompt = prompt
+        history_window = self.history_window
         self.chain = (
-            {
-                "context": lambda x: x["context"], 
-                "original_user_query": lambda x: x["original_user_query"], 
-                "chat_history": lambda x: "\n".join([f"{msg.type}: {msg.content}" for msg in x["chat_history"]])
-            }
+            RunnableParallel(
+                context=itemgetter("context"),
+                original_user_query=itemgetter("original_user_query"),
+                chat_history=RunnableLambda(lambda x: _format_history(x["chat_history"], history_window))
+            )
             | prompt
             | self.llm
             | StrOutputParser()
@@ -160,22 +182,33 @@ class GenerationService:
             logger.error(f"⚠️ Query expansion failed: {e}")
             return query # Fallback to original
 
+    @staticmethod
+    def _prepare_context(retrieved_docs):
+        """
+        Builds the context text and the sources footer.
+        Sources are deduplicated in first-seen order (dict keeps insertion order),
+        so identical retrievals always produce identical prompts/footers.
+        """
+        context_text = "\n\n".join(d.page_content for d in retrieved_docs)
+        unique_sources = dict.fromkeys(
+            _normalize_source(d.metadata.get('source', 'Unknown')) for d in retrieved_docs
+        )
+        
+        sources_text = ""
+        if unique_sources:
+            sources_text = "\n\n**Sources:**\n" + "\n".join(f"- {s}" for s in unique_sources)
+        return context_text, sources_text
+
     def generate_answer(self, original_query, retrieved_docs, chat_history=[]):
         """
         Modified to separate the 'Search Query' from the 'Original Query'
         """
-        # Format context from docs
-        context_text = "\n\n".join([d.page_content for d in retrieved_docs])
+        # Format context + collect sources in a single pass
+        context_text, sources_text = self._prepare_context(retrieved_docs)
         
         logger.info(f"generating answer for query: '{original_query}' with {len(retrieved_docs)} context chunks.")
         
         try:
-            # Append Sources to the response
-            unique_sources = set()
-            for d in retrieved_docs:
-                src = d.metadata.get('source', 'Unknown')
-                unique_sources.add(src)
-            
             # 1. Get LLM Response
             # Notice hum "question" key ki jagah "original_user_query" bhej rahe hain
             raw_response = self.chain.invoke({
@@ -186,46 +219,55 @@ class GenerationService:
             
             # 2. Parse Logic (Separator Split)
             final_answer = raw_response
-            if "### ANSWER ###" in raw_response:
+            if ANSWER_SEPARATOR in raw_response:
                 # Take everything AFTER the separator
-                final_answer = raw_response.split("### ANSWER ###")[1].strip()
+                final_answer = raw_response.split(ANSWER_SEPARATOR)[1].strip()
             
             # 3. Append Metadata
-            if unique_sources:
-                sources_text = "\n\n**Sources:**\n" + "\n".join([f"- {s}" for s in unique_sources])
+            if sources_text:
                 return final_answer + sources_text
                 
             return final_answer
         except Exception as e:
             logger.error(f"❌ Generation failed: {e}")
             return "Sorry, I encountered an error while generating the answer."
+    def _format_rag_messages(self, original_query, context_text, chat_history):
+        """Formats the RAG prompt once, so streaming can call the LLM directly"""
+        return self.prompt.format_messages(
+            context=context_text,
+            original_user_query=original_query,
+            chat_history=_format_history(chat_history, self.history_window)
+        )
+
+    @staticmethod
+    def _chunk_text(chunk):
+        """Extracts text from a streamed message chunk (str or list-of-parts content)"""
+        content = chunk.content
+        if isinstance(content, str):
+            return content
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+
     def stream_answer(self, original_query, retrieved_docs, chat_history=[]):
         """
         Streams the answer token-by-token. 
-        Note: The caller MUST handle parsing "### ANSWER ###" if using the current prompt structure.
-        """
-        # Format context from docs
-        context_text = "\n\n".join([d.page_content for d in retrieved_docs])
+        Note: The caller MUST handle parsing ANSWER_SEPARATOR if using the current prompt structure.
         
-        # Prepare Sources Text for the end
-        unique_sources = set()
-        for d in retrieved_docs:
-            src = d.metadata.get('source', 'Unknown')
-            unique_sources.add(src)
-        sources_text = ""
-        if unique_sources:
-             sources_text = "\n\n**Sources:**\n" + "\n".join([f"- {s}" for s in unique_sources])
-
-        input_payload = {
-            "context": context_text, 
-            "original_user_query": original_query, 
-            "chat_history": chat_history
-        }
+        Calls self.llm.stream directly with pre-formatted messages - skips the
+        RunnableSequence/StrOutputParser dispatch on every token.
+        """
+        # Format context + Sources Text for the end (single pass)
+        context_text, sources_text = self._prepare_context(retrieved_docs)
 
         # Stream Logic
         try:
-            for chunk in self.chain.stream(input_payload):
-                yield chunk
+            messages = self._format_rag_messages(original_query, context_text, chat_history)
+            for chunk in self.llm.stream(messages):
+                text = self._chunk_text(chunk)
+                if text:
+                    yield text
             
             # Yield Sources at the end
             if sources_text:
@@ -234,8 +276,6 @@ class GenerationService:
         except Exception as e:
             logger.error(f"❌ Streaming failed: {e}")
             yield "Error: Generation failed."
-            logger.error(f"❌ Streaming failed: {e}")
-            yield "Error: Generation failed."
 
     def generate_generic_response(self, query: str, chat_history=None) -> str:
         """Generate response for generic/chitchat queries WITHOUT retrieval"""
@@ -43,15 +43,18 @@ class ChatHistoryManager:
         """Returns sessions sorted by date (newest first)."""
         db = self._get_db_session()
         try:
-            sessions = db.query(ChatSession).order_by(ChatSession.created_at.desc()).all()
+            # List view only needs id/title/date - skip loading and decoding every session's messages
+            sessions = (
+                db.query(ChatSession.id, ChatSession.title, ChatSession.created_at)
+                .order_by(ChatSession.created_at.desc())
+                .all()
+            )
             # Return list of tuples (id, data_dict) to match previous interface
             result = []
             for s in sessions:
                 data = {
                     "title": s.title,
-                    "created_at": s.created_at.isoformat(),
-                    # We don't necessarily need all messages for the list view, but keeping it consistent
-                    "messages": s.messages
+                    "created_at": s.created_at.isoformat()
                 }
                 result.append((s.id, data))
             return result
@@ -3,16 +3,49 @@ Hybrid PDF Ingestion - Combines LlamaParse + Gemini Vision intelligently
 """
 
 import os
+import json
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from functools import partial
 from typing import List, Dict, Optional
 from pathlib import Path
 import fitz  # PyMuPDF
 
 from src.app.page_classifier import PageComplexityClassifier
 from src.app.vision_parser import VisionChartParser
+from src.core.disk_cache import DiskCache
 
 logger = logging.getLogger('app_logger')
 
+
+def _render_page(pdf_path: str, page_num: int, dpi: int, jpg_quality: int = 80) -> tuple:
+    """
+    Render a single PDF page to in-memory JPEG bytes (runs in a worker process)
+    
+    Each worker opens its own fitz.Document - documents can't be shared across processes.
+    
+    Returns:
+        Tuple of (page_number, image_bytes) or (page_number, None) on failure
+    """
+    try:
+        with fitz.open(pdf_path) as doc:
+            # fitz uses 0-indexing. No alpha channel - Vision doesn't use it and
+            # RGB-only pixmaps are 25% smaller and encode straight to JPEG
+            zoom = dpi / 72
+            pix = doc[page_num - 1].get_pixmap(
+                matrix=fitz.Matrix(zoom, zoom),
+                alpha=False,
+                colorspace=fitz.csRGB
+            )
+            img_bytes = pix.tobytes(output="jpeg", jpg_quality=jpg_quality)
+        return page_num, img_bytes
+    except Exception as e:
+        logger.error(f"Failed to convert page {page_num}: {e}")
+        return page_num, None
+
+
 class HybridPDFProcessor:
     """
     Intelligent PDF processing that routes pages to appropriate parser:
@@ -23,18 +56,30 @@ class HybridPDFProcessor:
     def __init__(
         self,
         enable_vision: bool = None,
-        complexity_threshold: int = 4
+        complexity_threshold: int = 4,
+        vision_concurrency: int = None,
+        cache_dir: str = None
     ):
         """
         Args:
             enable_vision: Enable Vision API (defaults to env ENABLE_VISION_PARSING)
             complexity_threshold: Score for classifying as complex
+            vision_concurrency: Max parallel Vision calls (defaults to env VISION_CONCURRENCY or 8)
+            cache_dir: Directory for persisted page classifications (defaults to env HYBRID_CACHE_DIR)
         """
         # Feature flag
         self.enable_vision = enable_vision
         if self.enable_vision is None:
             self.enable_vision = os.getenv('ENABLE_VISION_PARSING', 'false').lower() == 'true'
         
+        # Vision calls are network-bound, keep this below the provider's QPM limit
+        self.vision_concurrency = vision_concurrency or int(os.getenv('VISION_CONCURRENCY', '8'))
+        
+        # Page classifications are persisted by content hash so re-ingesting
+        # an unchanged PDF doesn't re-score every page
+        self.cache_dir = Path(cache_dir or os.getenv('HYBRID_CACHE_DIR', 'data/cache'))
+        self._classification_cache = None  # DiskCache, opened on first use
+        
         # Initialize components
         self.classifier = PageComplexityClassifier(complexity_threshold)
         
@@ -53,7 +98,8 @@ class HybridPDFProcessor:
     def enhance_llama_pages(
         self,
         llama_result: List[Dict],
-        pdf_path: str
+        pdf_path: str,
+        defer_merge: bool = False
     ) -> List[Dict]:
         """
         Take LlamaParse output and enhance complex pages with Vision
@@ -61,6 +107,8 @@ class HybridPDFProcessor:
         Args:
             llama_result: List of page dicts from LlamaParse
             pdf_path: Path to original PDF
+            defer_merge: Store Vision markdown under 'vision_append' instead of
+                         rebuilding each page string (read with page_text())
         
         Returns:
             Enhanced page list with Vision data appended
@@ -81,7 +129,7 @@ class HybridPDFProcessor:
             for i, page in enumerate(llama_result)
         ]
         
-        classifications = self.classifier.classify_batch(pages_for_classification)
+        classifications = self._classify_batch_cached(pages_for_classification)
         stats = self.classifier.get_statistics(classifications)
         
         logger.info(f"Classification results: {stats['simple']} simple, "
@@ -99,14 +147,11 @@ class HybridPDFProcessor:
         
         logger.info(f"Processing {len(vision_pages)} pages with Vision API: {vision_pages}")
         
-        # Step 2: Convert needed pages to images
-        temp_dir = Path('data/temp/vision_processing')
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        # Step 2: Render needed pages to in-memory images (no temp files)
+        page_images = self._pdf_to_images(pdf_path, vision_pages)
         
-        page_images = self._pdf_to_images(pdf_path, vision_pages, temp_dir)
-        
-        # Step 3: Process each complex page with Vision
-        enhanced_count = 0
+        # Step 3: Process complex pages with Vision (parallel - calls are I/O bound)
+        tasks = []
         
         for page_num in vision_pages:
             page_idx = page_num - 1
@@ -115,8 +160,8 @@ class HybridPDFProcessor:
                 logger.warning(f"Page {page_num} out of range, skipping")
                 continue
             
-            img_path = page_images.get(page_num)
-            if not img_path:
+            img_bytes = page_images.get(page_num)
+            if not img_bytes:
                 logger.warning(f"No image for page {page_num}, skipping Vision")
                 continue
             
@@ -131,104 +176,153 @@ class HybridPDFProcessor:
             else:
                 chart_type = 'auto'
             
-            try:
+            tasks.append((page_num, img_bytes, chart_type))
+        
+        enhanced_count = 0
+        result_lock = threading.Lock()
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(self.vision_concurrency, len(tasks)))) as executor:
+            futures = {}
+            for page_num, img_bytes, chart_type in tasks:
                 logger.info(f"  Processing page {page_num} as {chart_type}...")
-                
-                vision_result = self.vision_parser.extract_chart_data(
-                    img_path,
+                future = executor.submit(
+                    self.vision_parser.extract_chart_data,
+                    img_bytes,
                     chart_type=chart_type
                 )
+                futures[future] = page_num
+            
+            for future in as_completed(futures):
+                page_num = futures[future]
+                page_idx = page_num - 1
                 
-                if vision_result['success']:
-                    # Convert to markdown
-                    enhanced_content = self.vision_parser.convert_to_markdown(
-                        vision_result['data']
-                    )
-                    
-                    # Get existing content
-                    original_content = llama_result[page_idx].get('content') or \
-                                     llama_result[page_idx].get('text', '')
-                    
-                    # APPEND Vision data (don't replace!)
-                    combined_content = f"{original_content}\n\n### 🔍 Enhanced Vision Extraction\n\n{enhanced_content}"
-                    
-                    # Update page
-                    if 'content' in llama_result[page_idx]:
-                        llama_result[page_idx]['content'] = combined_content
-                    else:
-                        llama_result[page_idx]['text'] = combined_content
-                    
-                    llama_result[page_idx]['vision_enhanced'] = True
-                    llama_result[page_idx]['vision_data'] = vision_result['data']
+                try:
+                    vision_result = future.result()
                     
-                    enhanced_count += 1
-                    logger.info(f"  ✅ Page {page_num} enhanced successfully")
-                else:
-                    logger.warning(f"  ❌ Vision failed for page {page_num}: {vision_result.get('error')}")
-                    llama_result[page_idx]['vision_error'] = vision_result.get('error')
-            
-            except Exception as e:
-                logger.error(f"  ❌ Exception processing page {page_num}: {e}")
-                llama_result[page_idx]['vision_error'] = str(e)
+                    with result_lock:
+                        if vision_result['success']:
+                            # Convert to markdown
+                            enhanced_content = self.vision_parser.convert_to_markdown(
+                                vision_result['data']
+                            )
+                            
+                            # APPEND Vision data (don't replace!). With defer_merge the
+                            # base text is left untouched and joined on read via page_text()
+                            if defer_merge:
+                                llama_result[page_idx]['vision_append'] = enhanced_content
+                            else:
+                                key = 'content' if 'content' in llama_result[page_idx] else 'text'
+                                llama_result[page_idx][key] = self.page_text(llama_result[page_idx], enhanced_content)
+                            
+                            llama_result[page_idx]['vision_enhanced'] = True
+                            llama_result[page_idx]['vision_data'] = vision_result['data']
+                            
+                            enhanced_count += 1
+                            logger.info(f"  ✅ Page {page_num} enhanced successfully")
+                        else:
+                            logger.warning(f"  ❌ Vision failed for page {page_num}: {vision_result.get('error')}")
+                            llama_result[page_idx]['vision_error'] = vision_result.get('error')
+                
+                except Exception as e:
+                    logger.error(f"  ❌ Exception processing page {page_num}: {e}")
+                    with result_lock:
+                        llama_result[page_idx]['vision_error'] = str(e)
         
         logger.info(f"✅ Enhanced {enhanced_count}/{len(vision_pages)} complex pages with Vision")
         
-        # Cleanup temp images
+        return llama_result
+    
+    @staticmethod
+    def _merge_vision(original_content: str, enhanced_content: str) -> str:
+        return f"{original_content}\n\n### 🔍 Enhanced Vision Extraction\n\n{enhanced_content}"
+    
+    @classmethod
+    def page_text(cls, page: Dict, append: Optional[str] = None) -> str:
+        """Page text including Vision markdown (deferred 'vision_append' is joined only here)"""
+        base = page.get('content') or page.get('text', '')
+        append = append or page.get('vision_append')
+        return cls._merge_vision(base, append) if append else base
+    
+    def _classification_key(self, page: Dict) -> str:
+        """Stable cache key: classifier version + threshold + page inputs"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{PageComplexityClassifier.VERSION}:{self.classifier.threshold}:".encode())
+        h.update(json.dumps(page.get('metadata', {}), sort_keys=True, default=str).encode())
+        h.update(page.get('content', '').encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+    
+    def _classify_batch_cached(self, pages: List[Dict]) -> Dict[int, Dict]:
+        """
+        classify_batch with a disk-backed content-hash cache
+        
+        Only cache misses are sent to the classifier; falls back to a plain
+        classify_batch if the cache can't be opened.
+        """
         try:
-            for img_path in page_images.values():
-                if Path(img_path).exists():
-                    Path(img_path).unlink()
+            if self._classification_cache is None:
+                # SQLite-backed: safe to share between Celery worker processes
+                self._classification_cache = DiskCache(self.cache_dir / 'page_classifier.sqlite')
+            cache = self._classification_cache
+            keys = {page.get('page_number', 0): self._classification_key(page) for page in pages}
+            cached = cache.get_many(keys.values())
+            
+            results = {}
+            misses = []
+            for page in pages:
+                page_num = page.get('page_number', 0)
+                if keys[page_num] in cached:
+                    results[page_num] = cached[keys[page_num]]
+                else:
+                    misses.append(page)
+            
+            if misses:
+                fresh = self.classifier.classify_batch(misses, num_workers=os.cpu_count())
+                cache.set_many({keys[page_num]: info for page_num, info in fresh.items()})
+                results.update(fresh)
+            
+            logger.info(f"Page classification cache: {len(pages) - len(misses)} hits, {len(misses)} misses")
+            return results
         except Exception as e:
-            logger.warning(f"Cleanup failed: {e}")
-        
-        return llama_result
+            logger.warning(f"Classification cache unavailable ({e}), classifying without cache")
+            return self.classifier.classify_batch(pages, num_workers=os.cpu_count())
     
     def _pdf_to_images(
         self,
         pdf_path: str,
         page_numbers: List[int],
-        output_dir: Path,
-        dpi: int = 300
-    ) -> Dict[int, str]:
+        dpi: int = 200
+    ) -> Dict[int, bytes]:
         """
-        Convert specific PDF pages to PNG images
+        Render specific PDF pages to in-memory JPEG bytes
+        
+        Rendering is CPU-bound (libmupdf holds the GIL), so pages are
+        rendered in parallel across a process pool.
         
         Args:
             pdf_path: Path to PDF file
             page_numbers: List of page numbers (1-indexed)
-            output_dir: Directory to save images
-            dpi: Image resolution
+            dpi: Image resolution (Vision model downscales internally, 200 is plenty)
         
         Returns:
-            Dict mapping page_number -> image_path
+            Dict mapping page_number -> JPEG bytes
         """
         images = {}
         
+        if not page_numbers:
+            return images
+        
         try:
-            doc = fitz.open(pdf_path)
-            
-            for page_num in page_numbers:
-                try:
-                    # fitz uses 0-indexing
-                    page = doc[page_num - 1]
-                    
-                    # Render page to image
-                    pix = page.get_pixmap(dpi=dpi)
-                    
-                    # Save as PNG
-                    img_path = output_dir / f"page_{page_num}.png"
-                    pix.save(str(img_path))
-                    
-                    images[page_num] = str(img_path)
-                    logger.debug(f"Converted page {page_num} to {img_path}")
-                
-                except Exception as e:
-                    logger.error(f"Failed to convert page {page_num}: {e}")
+            max_workers = min(len(page_numbers), os.cpu_count() or 1)
+            render = partial(_render_page, str(pdf_path), dpi=dpi)
             
-            doc.close()
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for page_num, img_bytes in executor.map(render, page_numbers):
+                    if img_bytes:
+                        images[page_num] = img_bytes
+                        logger.debug(f"Rendered page {page_num} ({len(img_bytes) // 1024} KB)")
         
         except Exception as e:
-            logger.error(f"Failed to open PDF {pdf_path}: {e}")
+            logger.error(f"Failed to render PDF {pdf_path}: {e}")
         
         return images
 
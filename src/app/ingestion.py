@@ -5,10 +5,21 @@ Refactored to use Celery + Redis for Task Queueing.
 """
 
 import os
+import re
 import logging
 import asyncio
 import tempfile
+import hashlib
+import hmac
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import boto3
+import httpx
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, BotoCoreError
 from pathlib import Path
 from llama_parse import LlamaParse
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
@@ -17,15 +28,106 @@ from tenacity import (
     retry,
     stop_after_attempt,
     wait_exponential,
+    wait_exponential_jitter,
     retry_if_exception_type,
+    retry_if_exception,
     before_sleep_log
 )
-from src.core.database import get_db
+from src.app.page_classifier import PageComplexityClassifier
+from src.core.database import get_db, db_session, insert_missing
 from src.core.models import FileTracking
 from datetime import datetime
+from celery import group
 
 logger = logging.getLogger('app_logger')
 
+
+def _is_retryable_status(exc):
+    """Rate limits and server errors are transient; other 4xx (bad key, validation) are not."""
+    return (
+        isinstance(exc, httpx.HTTPStatusError)
+        and (exc.response.status_code == 429 or exc.response.status_code >= 500)
+    )
+
+
+# llama_parse reports failed jobs as plain Exceptions; retry those only when the
+# message points at rate limiting or a gateway error
+TRANSIENT_MESSAGE_PATTERN = re.compile(r'\b(?:429|502|503|504)\b|rate.?limit', re.IGNORECASE)
+
+
+def _is_transient_message(exc):
+    return bool(TRANSIENT_MESSAGE_PATTERN.search(str(exc)))
+
+
+# Per-job LlamaParse deadline; large multimodal parses routinely take several minutes
+PARSE_TIMEOUT_SECONDS = 900
+
+# LlamaParse's sync load_data runs here so a blocking parse never stalls the
+# event loop (S3 downloads and other parses keep overlapping)
+_PARSE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLAMAPARSE_THREADS", "16")),
+    thread_name_prefix="llamaparse"
+)
+
+HEADERS_TO_SPLIT_ON = [
+    ("#", "Header 1"),
+    ("##", "Header 2"),
+    ("###", "Header 3"),
+]
+
+# Any line the header splitter would treat as a split point
+MARKDOWN_HEADER_PATTERN = re.compile(r'^[ \t]*#{1,3} ', re.MULTILINE)
+
+
+# Parse results by PDF content hash, shared by every DocumentIngestion in the
+# process (workers build one per task). LRU-bounded: parses hold full page text.
+PARSE_CACHE_SIZE = 64
+_PARSE_CACHE = OrderedDict()
+
+# Cross-worker copy of the same cache in Redis (pickled, HMAC-signed so a
+# writable Redis can't inject objects); enabled when PARSE_CACHE_SECRET is set
+PARSE_CACHE_PREFIX = "parsed:"
+
+# bucket/key:ETag -> parse-cache key, so an unchanged object is served from the
+# cache after a HEAD, without downloading and re-hashing it
+PARSE_ETAG_PREFIX = "parsed-etag:"
+ETAG_ALIAS_CACHE_SIZE = 1024
+_ETAG_ALIASES = OrderedDict()
+
+
+def _remember_parse(cache_key, result):
+    _PARSE_CACHE[cache_key] = result
+    if len(_PARSE_CACHE) > PARSE_CACHE_SIZE:
+        _PARSE_CACHE.popitem(last=False)
+
+# S3 object tag set on successfully ingested PDFs (value = object ETag)
+INGESTED_TAG = 'ingested'
+# GetObjectTagging calls in flight while the producer checks untracked keys
+TAG_LOOKUP_THREADS = 16
+# Countdown added per queued task so workers don't all hit LlamaParse at once
+SKEW_STEP_SECONDS = 0.05
+
+PARSING_SYSTEM_PROMPT = """You are analyzing a technical PDF document that may contain rotated content.
+
+CRITICAL EXTRACTION REQUIREMENTS:
+
+📊 FOR GRAPHS/CHARTS (including rotated/sideways):
+- Extract EVERY bar label with exact values and units
+- Example: "Wohnraum: 74 dBA", "Dieselbox: 112 dBA"
+- Include chart titles, figure numbers (e.g., "Bild 17.17")
+- Preserve original language (German/Swedish/English)
+
+📋 FOR TABLES:
+- Extract as complete markdown tables
+- Include ALL rows, columns, headers, units
+- Do NOT round numeric values
+
+🎯 STRICT RULES:
+- Do NOT summarize - extract verbatim
+- Handle rotated content (90°, 180°, 270°)
+- Read small/faint text carefully
+- Preserve ALL technical terminology exactly"""
+
 class DocumentIngestion:
     def __init__(self, config):
         self.config = config
@@ -33,131 +135,62 @@ class DocumentIngestion:
         self.should_clear_db = False 
         # Note: Config change detection removed for now in Queue architecture shift.
         # To restore, implement a ConfigTracking table.
-    
-    def _check_rotation(self, pdf_path):
-        """Check if PDF has rotated pages using PyMuPDF (FREE - Local)"""
-        try:
-            import fitz  # PyMuPDF
-            doc = fitz.open(str(pdf_path))
-            has_rotation = any(page.rotation != 0 for page in doc)
-            doc.close()
-            return has_rotation
-        except Exception as e:
-            logger.warning(f"Could not check rotation: {e}")
-            return False
-    
-    def _auto_rotate_pdf(self, pdf_path):
-        """Auto-fix rotation and return corrected path (FREE - Local)"""
-        try:
-            import fitz  # PyMuPDF
-            doc = fitz.open(str(pdf_path))
-            
-            # Fix rotation for all pages
-            for page in doc:
-                if page.rotation != 0:
-                    page.set_rotation(0)
-            
-            # Save to temp file with _fixed suffix
-            fixed_path = str(pdf_path).replace('.pdf', '_fixed.pdf')
-            doc.save(fixed_path)
-            doc.close()
-            
-            logger.info(f"✅ Auto-rotated PDF: {fixed_path}")
-            return Path(fixed_path)
-        except Exception as e:
-            logger.error(f"Failed to auto-rotate PDF: {e}")
-            return pdf_path  # Return original if fix fails
-
-    async def process_file(self, file_path, check_processed=True):
-        """Processes a single PDF file using Optimized LlamaParse Settings"""
-        check_db = check_processed
         
-        # S3 Download Logic
-        bucket_name = os.getenv("S3_BUCKET_NAME", "neel-rag-data-2026")
-        s3_key = str(file_path).replace("\\", "/") # Ensure forward slashes for S3
-        filename = Path(s3_key).name
-        
-        # Setup S3 Client
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            region_name=os.getenv("AWS_REGION", "us-east-1")
-        )
-
-        if check_db:
-            db = next(get_db())
-            try:
-                exists = db.query(FileTracking).filter(
-                    FileTracking.filename == filename,
-                    FileTracking.status == "COMPLETED"
-                ).first()
-                if exists:
-                    logger.info(f"Skipping {filename} (Already processed)")
-                    # FIX #7: Close DB before early return
-                    db.close()
-                    return []
-            finally:
-                # Redundant but safe
-                if db:
-                    db.close()
-
-        logger.info(f"Downloading {s3_key} from S3...")
-        
-        # FIX #5: Add S3 timeout configuration
-        from botocore.config import Config
-        from botocore.exceptions import ClientError, BotoCoreError
-        
-        s3_config = Config(
-            connect_timeout=10,
-            read_timeout=60,
-            retries={'max_attempts': 3}
+        # Multipart download tuning (defaults serialize small files with 256 KB reads)
+        s3_cfg = config.get('s3', {})
+        mb = 1024 * 1024
+        transfer_concurrency = s3_cfg.get('max_concurrency', 16)
+        self._transfer_config = TransferConfig(
+            multipart_threshold=s3_cfg.get('multipart_threshold_mb', 8) * mb,
+            multipart_chunksize=s3_cfg.get('multipart_chunksize_mb', 16) * mb,
+            max_concurrency=transfer_concurrency,
+            io_chunksize=s3_cfg.get('io_chunksize_mb', 1) * mb,
+            use_threads=True
         )
         
-        # Setup S3 Client with timeout
-        s3_with_timeout = boto3.client(
+        # One S3 client per instance (credential resolution + connection pool reused
+        # across files). Pool sized so every ranged GET of every concurrent
+        # process_file call gets a connection instead of queueing on the pool.
+        file_concurrency = config.get('parsing', {}).get('max_concurrency', 8)
+        self._s3 = boto3.client(
             's3',
             aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
             aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
             region_name=os.getenv("AWS_REGION", "us-east-1"),
-            config=s3_config
+            config=Config(
+                connect_timeout=10,
+                read_timeout=60,
+                max_pool_connections=max(50, transfer_concurrency * file_concurrency),
+                retries={'max_attempts': 10, 'mode': 'adaptive'}
+            )
         )
         
-        # Create Temp File with Retry Logic
-        # FIX #8: Use specific exception types (not generic Exception)
-        @retry(
-            stop=stop_after_attempt(3),
-            wait=wait_exponential(multiplier=1, min=2, max=10),
-            retry=retry_if_exception_type((ClientError, BotoCoreError, ConnectionError)),
-            before_sleep=before_sleep_log(logger, logging.WARNING)
+        # Splitters are stateless between calls - build once, reuse for every file
+        self._md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON)
+        self._text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=config['parsing']['chunk_size'],
+            chunk_overlap=config['parsing']['chunk_overlap']
         )
-        def download_with_retry():
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                s3_with_timeout.download_fileobj(bucket_name, s3_key, tmp)
-                return Path(tmp.name)
         
-        # FIX #2: Track original temp path separately
-        original_temp_path = download_with_retry()
-        temp_path = original_temp_path
-            
-        # Track metadata for enrichment
-        fixed_pdf_path = None
-        rotation_detected = False
-        parsing_method = "unknown"
+        # LlamaParse clients are built on first use and reused across files,
+        # keeping their HTTP sessions (and keep-alive connections) warm
+        self._parser = None
+        self._fallback_parser = None
         
-        try:
-            # 1. ROTATION DETECTION AND AUTO-FIX (FREE - PyMuPDF)
-            if self._check_rotation(temp_path):
-                rotation_detected = True
-                logger.warning(f"⚠️ Rotation detected in {filename}")
-                fixed_pdf_path = self._auto_rotate_pdf(temp_path)
-                # Use the corrected PDF for parsing
-                temp_path = fixed_pdf_path
-            
-            logger.info(f"Processing {filename} with LlamaParse (Vendor Multimodal Only)...")
-            
+        # Page router for parsing.adaptive_routing (see _parse_adaptive)
+        self._classifier = PageComplexityClassifier(
+            complexity_threshold=config['parsing'].get('complexity_threshold', 4)
+        )
+        
+        # Parse-result cache (see _parse_cache_key / _load_shared_parse)
+        self._parse_fingerprint = None
+        self._redis = None
+    
+    def _get_parser(self):
+        """Vendor Multimodal LlamaParse client (created once per instance)"""
+        if self._parser is None:
             # CLEAN VENDOR MULTIMODAL CONFIGURATION (No premium_mode conflict)
-            parser = LlamaParse(
+            self._parser = LlamaParse(
                 result_type="markdown",
                 verbose=True,
                 language=self.config['parsing']['language'],
@@ -165,169 +198,583 @@ class DocumentIngestion:
                 vendor_multimodal_model_name="gemini-2.5-flash",
                 vendor_multimodal_api_key=os.getenv("GOOGLE_API_KEY"),
                 # Using system_prompt instead of deprecated parsing_instruction
-                system_prompt="""You are analyzing a technical PDF document that may contain rotated content.
+                system_prompt=PARSING_SYSTEM_PROMPT,
+                max_timeout=self._parse_timeout()
+            )
+        return self._parser
 
-CRITICAL EXTRACTION REQUIREMENTS:
+    def _parse_timeout(self):
+        """
+        Seconds LlamaParse waits for a job before giving up. Enforced inside load_data, so
+        the parse thread actually finishes (an asyncio timeout can't stop a worker thread).
+        """
+        return self.config['parsing'].get('timeout_seconds', PARSE_TIMEOUT_SECONDS)
 
-📊 FOR GRAPHS/CHARTS (including rotated/sideways):
-- Extract EVERY bar label with exact values and units
-- Example: "Wohnraum: 74 dBA", "Dieselbox: 112 dBA"
-- Include chart titles, figure numbers (e.g., "Bild 17.17")
-- Preserve original language (German/Swedish/English)
+    def _get_fallback_parser(self):
+        """Standard text-mode LlamaParse client (No Vendor Multimodal)"""
+        if self._fallback_parser is None:
+            self._fallback_parser = LlamaParse(
+                result_type="text",
+                verbose=True,
+                language=self.config['parsing']['language'],
+                max_timeout=self._parse_timeout()
+            )
+        return self._fallback_parser
 
-📋 FOR TABLES:
-- Extract as complete markdown tables
-- Include ALL rows, columns, headers, units
-- Do NOT round numeric values
+    def _fix_rotation(self, pdf_bytes):
+        """
+        Detect and clear page rotation with PyMuPDF in a single open (FREE - Local).
+        The PDF is only re-serialized when some page is actually rotated.
+        
+        Returns:
+            (pdf_bytes, rotation_detected) - original bytes if nothing to fix or on error
+        """
+        try:
+            import fitz  # PyMuPDF
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+                rotated = [page for page in doc if page.rotation != 0]
+                if not rotated:
+                    return pdf_bytes, False
+                for page in rotated:
+                    page.set_rotation(0)
+                fixed_bytes = doc.tobytes()
+            
+            logger.info(f"✅ Auto-rotated PDF ({len(rotated)} pages, {len(fixed_bytes)} bytes)")
+            return fixed_bytes, True
+        except Exception as e:
+            logger.warning(f"Could not check/fix rotation: {e}")
+            return pdf_bytes, False
+        finally:
+            # Drop MuPDF's cached objects so long-lived workers don't grow RSS per file
+            try:
+                fitz.TOOLS.store_shrink(100)
+            except Exception:
+                pass
 
-🎯 STRICT RULES:
-- Do NOT summarize - extract verbatim
-- Handle rotated content (90°, 180°, 270°)
-- Read small/faint text carefully
-- Preserve ALL technical terminology exactly"""
+    def _parse_cache_key(self, pdf_bytes):
+        """Content hash of the PDF plus a fingerprint of everything that shapes the parse."""
+        if self._parse_fingerprint is None:
+            parsing = self.config['parsing']
+            settings = (
+                f"{PARSING_SYSTEM_PROMPT}|{parsing['language']}|gemini-2.5-flash|"
+                f"{parsing.get('adaptive_routing', False)}|{parsing.get('complexity_threshold', 4)}|"
+                f"{parsing.get('adaptive_max_complex_ratio', 0.6)}"
             )
+            self._parse_fingerprint = hashlib.blake2b(settings.encode("utf-8"), digest_size=8).hexdigest()
+        digest = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+        return f"{digest}:{self._parse_fingerprint}"
+
+    def _shared_parse_cache(self):
+        """(redis client, secret) or None when the Redis parse cache is disabled/unreachable."""
+        secret = os.getenv("PARSE_CACHE_SECRET")
+        if not secret:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return self._redis, secret.encode("utf-8")
+
+    def _lookup_parse(self, cache_key):
+        """Parse result for cache_key from the in-process LRU, then the shared Redis cache."""
+        cached = _PARSE_CACHE.get(cache_key)
+        if cached is not None:
+            _PARSE_CACHE.move_to_end(cache_key)
+            return cached
+        cached = self._load_shared_parse(cache_key)
+        if cached is not None:
+            _remember_parse(cache_key, cached)
+        return cached
+
+    def _head_etag(self, bucket_name, s3_key):
+        """Current ETag of the object, or None if it can't be read (download decides)."""
+        try:
+            return self._s3.head_object(Bucket=bucket_name, Key=s3_key)['ETag'].strip('"')
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(f"HEAD failed for {s3_key}: {e}")
+            return None
+
+    def _cache_key_for_etag(self, etag_alias):
+        """Parse-cache key previously recorded for this bucket/key/ETag, if any."""
+        cache_key = _ETAG_ALIASES.get(etag_alias)
+        if cache_key is not None:
+            _ETAG_ALIASES.move_to_end(etag_alias)
+            return cache_key
+        shared = self._shared_parse_cache()
+        if shared is None:
+            return None
+        client, secret = shared
+        try:
+            value = client.get(PARSE_ETAG_PREFIX + etag_alias)
+            if not value:
+                return None
+            mac, cache_key = value.decode("utf-8").split("|", 1)
+            expected = hmac.new(secret, f"{etag_alias}|{cache_key}".encode("utf-8"), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(mac, expected):
+                logger.warning(f"Ignoring ETag alias {etag_alias}: bad signature")
+                return None
+            return cache_key
+        except Exception as e:
+            logger.warning(f"ETag alias read failed: {e}")
+            return None
+
+    def _remember_etag(self, etag_alias, cache_key):
+        _ETAG_ALIASES[etag_alias] = cache_key
+        _ETAG_ALIASES.move_to_end(etag_alias)
+        if len(_ETAG_ALIASES) > ETAG_ALIAS_CACHE_SIZE:
+            _ETAG_ALIASES.popitem(last=False)
+        shared = self._shared_parse_cache()
+        if shared is None:
+            return
+        client, secret = shared
+        try:
+            mac = hmac.new(secret, f"{etag_alias}|{cache_key}".encode("utf-8"), hashlib.sha256).hexdigest()
+            ttl = int(self.config['parsing'].get('parse_cache_ttl_hours', 24) * 3600)
+            client.setex(PARSE_ETAG_PREFIX + etag_alias, ttl, f"{mac}|{cache_key}")
+        except Exception as e:
+            logger.warning(f"ETag alias write failed: {e}")
+
+    def _load_shared_parse(self, cache_key):
+        shared = self._shared_parse_cache()
+        if shared is None:
+            return None
+        client, secret = shared
+        try:
+            blob = client.get(PARSE_CACHE_PREFIX + cache_key)
+            if not blob:
+                return None
+            mac, payload = blob[:32], blob[32:]
+            if not hmac.compare_digest(mac, hmac.new(secret, payload, hashlib.sha256).digest()):
+                logger.warning(f"Ignoring parse cache entry {cache_key}: bad signature")
+                return None
+            return pickle.loads(payload)
+        except Exception as e:
+            logger.warning(f"Parse cache read failed ({e}), parsing instead")
+            return None
+
+    def _store_shared_parse(self, cache_key, result):
+        shared = self._shared_parse_cache()
+        if shared is None:
+            return
+        client, secret = shared
+        try:
+            payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            mac = hmac.new(secret, payload, hashlib.sha256).digest()
+            ttl = int(self.config['parsing'].get('parse_cache_ttl_hours', 24) * 3600)
+            client.setex(PARSE_CACHE_PREFIX + cache_key, ttl, mac + payload)
+        except Exception as e:
+            logger.warning(f"Parse cache write failed: {e}")
+
+    async def _parse_adaptive(self, pdf_bytes, filename, extra_info):
+        """
+        Cheap text-mode parse of every page, then multimodal re-parse of only the
+        pages PageComplexityClassifier marks mixed/complex (charts, tables).
+        
+        Returns:
+            Per-page documents with page_label set, or None when routing doesn't
+            pay off (most pages complex) or the page mapping is unreliable -
+            the caller then runs the full multimodal parse.
+        """
+        import fitz  # PyMuPDF
+        
+        text_docs = await self._parse_with_retry(self._get_fallback_parser(), pdf_bytes, extra_info)
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            page_count = doc.page_count
+            if not text_docs or len(text_docs) != page_count:
+                logger.info(f"Adaptive routing skipped for {filename}: {len(text_docs or [])} parsed pages vs {page_count} in PDF")
+                return None
             
-            # 2. Execute Parse with Retry
+            classifications = self._classifier.classify_batch([
+                {'page_number': i + 1, 'content': d.text, 'metadata': {}}
+                for i, d in enumerate(text_docs)
+            ])
+            complex_pages = sorted(
+                n for n, info in classifications.items()
+                if info['classification'] in ('mixed', 'complex')
+            )
+            if len(complex_pages) > page_count * self.config['parsing'].get('adaptive_max_complex_ratio', 0.6):
+                logger.info(f"Adaptive routing skipped for {filename}: {len(complex_pages)}/{page_count} pages complex")
+                return None
+            
+            if complex_pages:
+                doc.select([n - 1 for n in complex_pages])
+                subset_bytes = doc.tobytes()
+        
+        for i, d in enumerate(text_docs):
+            d.metadata['page_label'] = str(i + 1)
+        
+        if complex_pages:
+            vision_docs = await self._parse_with_retry(
+                self._get_parser(), subset_bytes, {"file_name": filename}
+            )
+            if vision_docs and len(vision_docs) == len(complex_pages):
+                for page_num, vision_doc in zip(complex_pages, vision_docs):
+                    vision_doc.metadata['page_label'] = str(page_num)
+                    text_docs[page_num - 1] = vision_doc
+            else:
+                logger.warning(f"Multimodal subset returned {len(vision_docs or [])} pages for {len(complex_pages)}; keeping text mode")
+        
+        logger.info(f"🔀 Adaptive routing for {filename}: {len(complex_pages)}/{page_count} pages multimodal")
+        return text_docs
+
+    async def _parse_pdf(self, pdf_bytes, filename):
+        """
+        Rotation fix + LlamaParse (multimodal, falling back to text mode).
+        
+        Returns:
+            (documents, parsing_method, rotation_detected)
+        """
+        # Track metadata for enrichment
+        parsing_method = "unknown"
+        # LlamaParse needs a file name when given raw bytes
+        extra_info = {"file_name": filename}
+        
+        # 1. ROTATION DETECTION AND AUTO-FIX (FREE - PyMuPDF)
+        # Use the corrected PDF for parsing
+        pdf_bytes, rotation_detected = self._fix_rotation(pdf_bytes)
+        if rotation_detected:
+            logger.warning(f"⚠️ Rotation detected in {filename}")
+
+        if self.config['parsing'].get('adaptive_routing', False):
             try:
-                 documents = await self._parse_with_retry(parser, str(temp_path))
-                 if not documents:
-                     raise ValueError("LlamaParse returned empty documents.")
-                 parsing_method = "multimodal"
+                documents = await self._parse_adaptive(pdf_bytes, filename, extra_info)
+                if documents:
+                    return documents, "adaptive", rotation_detected
             except Exception as e:
-                logger.warning(f"Multimodal Parsing failed for {filename}: {e}. Retrying with Standard Text Mode...")
-                # Log the specific error for debugging
-                logger.error(f"DEBUG: Multimodal failure reason: {str(e)}")
-                try:
-                    # FALLBACK: Standard Mode (No Vendor Multimodal)
-                    fallback_parser = LlamaParse(
-                        result_type="text",
-                        verbose=True,
-                        language=self.config['parsing']['language']
-                    )
-                    documents = await self._parse_with_retry(fallback_parser, str(temp_path))
-                    parsing_method = "text_fallback"
-                    logger.info(f"Fallback parsing successful for {filename}")
-                except Exception as e2:
-                    logger.error(f"Processing failed for {filename} after retries and fallback: {e2}")
-                    raise e2
+                logger.warning(f"Adaptive routing failed for {filename}: {e}. Using full multimodal parse...")
+        
+        logger.info(f"Processing {filename} with LlamaParse (Vendor Multimodal Only)...")
+
+        # 2. Execute Parse with Retry
+        try:
+             documents = await self._parse_with_retry(self._get_parser(), pdf_bytes, extra_info)
+             if not documents:
+                 raise ValueError("LlamaParse returned empty documents.")
+             parsing_method = "multimodal"
+        except Exception as e:
+            logger.warning(f"Multimodal Parsing failed for {filename}: {e}. Retrying with Standard Text Mode...")
+            # Log the specific error for debugging
+            logger.error(f"DEBUG: Multimodal failure reason: {str(e)}")
+            try:
+                # FALLBACK: Standard Mode (No Vendor Multimodal)
+                documents = await self._parse_with_retry(self._get_fallback_parser(), pdf_bytes, extra_info)
+                parsing_method = "text_fallback"
+                logger.info(f"Fallback parsing successful for {filename}")
+            except Exception as e2:
+                logger.error(f"Processing failed for {filename} after retries and fallback: {e2}")
+                raise e2
+        
+        return documents, parsing_method, rotation_detected
+
+    async def process_file(self, file_path, check_processed=True):
+        """Processes a single PDF file using Optimized LlamaParse Settings"""
+        check_db = check_processed
+        
+        # S3 Download Logic
+        bucket_name = os.getenv("S3_BUCKET_NAME", "neel-rag-data-2026")
+        s3_key = str(file_path).replace("\\", "/") # Ensure forward slashes for S3
+        filename = Path(s3_key).name
+        
+        if check_db:
+            # Column-only query: a tuple, not a hydrated ORM object
+            with db_session() as db:
+                exists = db.query(FileTracking.filename).filter(
+                    FileTracking.filename == filename,
+                    FileTracking.status == "COMPLETED"
+                ).first()
+            if exists:
+                logger.info(f"Skipping {filename} (Already processed)")
+                return []
+
+        # Same object version (ETag) already parsed - by this worker or, with the
+        # shared cache, any worker - skips the download as well as the parse
+        etag = self._head_etag(bucket_name, s3_key)
+        etag_alias = f"{bucket_name}/{s3_key}:{etag}" if etag else None
+        cache_key = self._cache_key_for_etag(etag_alias) if etag_alias else None
+        cached = self._lookup_parse(cache_key) if cache_key else None
+        pdf_bytes = None
+        
+        if cached is None:
+            logger.info(f"Downloading {s3_key} from S3...")
             
+            # Download into a spooled buffer with Retry Logic - stays in memory unless the
+            # PDF exceeds s3.spool_max_mb, so LlamaParse gets bytes without a disk round-trip
+            # FIX #8: Use specific exception types (not generic Exception)
+            spool_max = self.config.get('s3', {}).get('spool_max_mb', 64) * 1024 * 1024
+
+            @retry(
+                stop=stop_after_attempt(3),
+                wait=wait_exponential(multiplier=1, min=2, max=10),
+                retry=retry_if_exception_type((ClientError, BotoCoreError, ConnectionError)),
+                before_sleep=before_sleep_log(logger, logging.WARNING)
+            )
+            def download_with_retry():
+                with tempfile.SpooledTemporaryFile(max_size=spool_max) as buf:
+                    self._s3.download_fileobj(bucket_name, s3_key, buf, Config=self._transfer_config)
+                    buf.seek(0)
+                    return buf.read()
             
-            # Assemble full text with page markers
-            full_text_parts = []
-            for i, doc in enumerate(documents):
-                # FIX #10: Validate page number (fallback to index if invalid)
-                page_num = doc.metadata.get('page_label', '')
-                if not page_num or str(page_num).strip() == '':
-                    page_num = str(i + 1)  # Use 1-indexed page number as fallback
-                
-                page_marker = f"\n\n--- [PAGE {page_num}] ---\n"
-                full_text_parts.append(page_marker + doc.text)
-                
-            full_text = "".join(full_text_parts)
+            pdf_bytes = download_with_retry()
             
-            # Check for encoding issues (garbled text) - Warning only
-            garbled_count = full_text.count('�')
-            if garbled_count > 10:
-                logger.warning(f"⚠️ Possible encoding issues in {filename}: {garbled_count} replacement characters found")
+        try:
+            # Identical content under another key (re-uploads, retries) reuses the
+            # parse instead of paying LlamaParse again: in-process LRU first, then
+            # the Redis copy other workers may have written
+            if cached is None:
+                cache_key = self._parse_cache_key(pdf_bytes)
+                cached = self._lookup_parse(cache_key)
             
-            logger.info(f"✅ Extraction Complete: {len(full_text)} characters extracted, {len(documents)} pages")
+            if cached is not None:
+                documents, parsing_method, rotation_detected = cached
+                logger.info(f"♻️  Reusing parse of identical content for {filename} ({cache_key})")
+            else:
+                documents, parsing_method, rotation_detected = await self._parse_pdf(pdf_bytes, filename)
+                _remember_parse(cache_key, (documents, parsing_method, rotation_detected))
+                self._store_shared_parse(cache_key, (documents, parsing_method, rotation_detected))
             
-            # 3. Double-Pass Chunking
+            if etag_alias:
+                self._remember_etag(etag_alias, cache_key)
+            
+            # 3. Double-Pass Chunking (page by page, no full-text copy)
             logger.info("Chunking content (Parent Chunks)...")
             
-            headers_to_split_on = [
-                ("#", "Header 1"),
-                ("##", "Header 2"),
-                ("###", "Header 3"),
-            ]
-            markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-            md_header_splits = markdown_splitter.split_text(full_text)
+            md_header_splits, total_chars, garbled_count = self._split_pages(documents)
             
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.config['parsing']['chunk_size'],
-                chunk_overlap=self.config['parsing']['chunk_overlap']
-            )
+            # Check for encoding issues (garbled text) - Warning only
+            if garbled_count > 10:
+                logger.warning(f"⚠️ Possible encoding issues in {filename}: {garbled_count} replacement characters found")
+            
+            logger.info(f"✅ Extraction Complete: {total_chars} characters extracted, {len(documents)} pages")
             
-            parent_chunks = text_splitter.split_documents(md_header_splits)
+            # File-level metadata goes on the (~10x fewer) header splits;
+            # split_documents copies it onto every parent chunk
+            file_metadata = {
+                'source': filename,
+                'ingestion_timestamp': datetime.utcnow().isoformat(),
+                'parsing_method': parsing_method,
+                'rotation_fixed': rotation_detected,
+                'model_version': 'gemini-2.5-flash',
+            }
+            for split in md_header_splits:
+                split.metadata.update(file_metadata)
+            
+            parent_chunks = self._text_splitter.split_documents(md_header_splits)
             
             # FIX #6: Validate that chunking produced results
             if not parent_chunks or len(parent_chunks) == 0:
-                error_msg = f"Chunking failed for {filename}: No parent chunks created from {len(full_text)} chars"
+                error_msg = f"Chunking failed for {filename}: No parent chunks created from {total_chars} chars"
                 logger.error(error_msg)
                 raise ValueError(error_msg)
             
             logger.info(f"✅ Created {len(parent_chunks)} parent chunks")
             
-            # 4. METADATA ENRICHMENT
-            from datetime import datetime
-            ingestion_timestamp = datetime.utcnow().isoformat()
-            
+            # 4. METADATA ENRICHMENT (file-level fields were set before splitting)
+            total_chunks = len(parent_chunks)
             for chunk in parent_chunks:
-                chunk.metadata.update({
-                    'source': filename,
-                    'ingestion_timestamp': ingestion_timestamp,
-                    'parsing_method': parsing_method,
-                    'rotation_fixed': rotation_detected,
-                    'model_version': 'gemini-2.5-flash',
-                    'total_chunks': len(parent_chunks)
-                })
+                chunk.metadata['total_chunks'] = total_chunks
             
-            logger.info(f"📊 Ingestion Summary for {filename}:")
-            logger.info(f"   - Rotation Fixed: {rotation_detected}")
-            logger.info(f"   - Parsing Method: {parsing_method}")
-            logger.info(f"   - Total Pages: {len(documents)}")
-            logger.info(f"   - Total Chunks: {len(parent_chunks)}")
-            logger.info(f"   - Avg Chunk Size: {len(full_text) // len(parent_chunks) if parent_chunks else 0} chars")
+            logger.info(
+                f"📊 Ingestion Summary for {filename}:\n"
+                f"   - Rotation Fixed: {rotation_detected}\n"
+                f"   - Parsing Method: {parsing_method}\n"
+                f"   - Total Pages: {len(documents)}\n"
+                f"   - Total Chunks: {total_chunks}\n"
+                f"   - Avg Chunk Size: {total_chars // total_chunks} chars"
+            )
             
             return parent_chunks
         
         finally:
-            # FIX #2: Cleanup both original and fixed PDFs properly
-            # Cleanup original downloaded PDF
-            if original_temp_path and original_temp_path.exists():
-                try:
-                    original_temp_path.unlink()
-                    logger.debug(f"🧹 Cleaned up original temp file: {original_temp_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to delete original temp file: {e}")
-            
-            # Cleanup fixed PDF if it was created (and is different from original)
-            if fixed_pdf_path and fixed_pdf_path.exists() and fixed_pdf_path != original_temp_path:
+            # Drop the in-memory PDF promptly (large files, long-lived workers)
+            pdf_bytes = None
+
+    @staticmethod
+    def _completed_filenames(filenames):
+        """Returns the subset of filenames already marked COMPLETED (single IN query)."""
+        if not filenames:
+            return set()
+        with db_session() as db:
+            rows = db.query(FileTracking.filename).filter(
+                FileTracking.filename.in_(filenames),
+                FileTracking.status == "COMPLETED"
+            ).all()
+        return {row.filename for row in rows}
+
+    async def process_files(self, file_paths, check_processed=True, on_chunks=None):
+        """
+        Processes several files concurrently (used by process_document_batch_task).
+        Parsing is network-bound on LlamaParse, so a semaphore-bounded gather
+        gives near-linear speedup without threads. Failures are logged and the
+        file is left out of the result.
+        
+        Args:
+            on_chunks: Optional callable(file_path, chunks). When given, each
+                file's chunks are handed off as soon as that file finishes
+                (e.g. to RetrievalService.add_documents) and are not kept, so
+                memory stays bounded by max_concurrency instead of the corpus.
+        
+        Returns:
+            Flattened list of parent chunks from all files that succeeded, or
+            the number of chunks handed to on_chunks when it is given
+        """
+        if check_processed:
+            # One query for the whole batch instead of one per process_file call
+            names = {f: Path(str(f).replace("\\", "/")).name for f in file_paths}
+            completed = self._completed_filenames(list(names.values()))
+            for f in file_paths:
+                if names[f] in completed:
+                    logger.info(f"Skipping {names[f]} (Already processed)")
+            file_paths = [f for f in file_paths if names[f] not in completed]
+
+        sem = asyncio.Semaphore(self.config['parsing'].get('max_concurrency', 8))
+
+        async def _bounded(file_path):
+            async with sem:
                 try:
-                    fixed_pdf_path.unlink()
-                    logger.debug(f"🧹 Cleaned up fixed PDF: {fixed_pdf_path}")
+                    return file_path, await self.process_file(file_path, check_processed=False)
                 except Exception as e:
-                    logger.warning(f"Failed to delete fixed PDF: {e}")
+                    return file_path, e
+
+        all_chunks = []
+        flushed = 0
+        for future in asyncio.as_completed([_bounded(f) for f in file_paths]):
+            file_path, result = await future
+            if isinstance(result, Exception):
+                logger.error(f"❌ Failed to process {file_path}: {result}")
+            elif result:
+                if on_chunks is None:
+                    all_chunks.extend(result)
+                else:
+                    on_chunks(file_path, result)
+                    flushed += len(result)
+        return all_chunks if on_chunks is None else flushed
 
+    def _split_pages(self, documents):
+        """
+        Header-split parsed pages one at a time instead of joining them into
+        a single full_text string first.
+        
+        The header stack is carried across page boundaries so a page that
+        continues a section keeps the section's headers, and its leading
+        text is appended to the previous split (matching what a single pass
+        over the joined text would produce, e.g. tables broken across pages).
+        Each split records the page it starts on as 'page_label'.
+        
+        Returns:
+            (md_header_splits, total_chars, garbled_count)
+        """
+        levels = [name for _, name in HEADERS_TO_SPLIT_ON]
+        splits = []
+        carry = {}
+        total_chars = 0
+        garbled_count = 0
+        
+        for i, doc in enumerate(documents):
+            # FIX #10: Validate page number (fallback to index if invalid)
+            page_num = doc.metadata.get('page_label', '')
+            if not page_num or str(page_num).strip() == '':
+                page_num = str(i + 1)  # Use 1-indexed page number as fallback
+            
+            page_text = f"\n\n--- [PAGE {page_num}] ---\n{doc.text}"
+            total_chars += len(page_text)
+            garbled_count += page_text.count('�')
+            
+            if MARKDOWN_HEADER_PATTERN.search(page_text):
+                page_splits = self._md_splitter.split_text(page_text)
+            else:
+                # Plain text (e.g. the text fallback parser): nothing to split on
+                page_splits = [Document(page_content=page_text.strip(), metadata={})]
+            
+            for j, split in enumerate(page_splits):
+                # Inherit headers above the highest level this split defines
+                present = [levels.index(k) for k in split.metadata if k in levels]
+                top = min(present) if present else len(levels)
+                inherited = {k: v for k, v in carry.items() if levels.index(k) < top}
+                split.metadata = {**inherited, **split.metadata}
+                
+                if j == 0 and not present and splits:
+                    # Same section continues from the previous page
+                    splits[-1].page_content += "\n" + split.page_content
+                else:
+                    # Page the split starts on (split_documents copies it to every chunk)
+                    split.metadata['page_label'] = page_num
+                    splits.append(split)
+            
+            if splits:
+                carry = {k: v for k, v in splits[-1].metadata.items() if k in levels}
+        
+        return splits, total_chars, garbled_count
+    
     @retry(
-        stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type(Exception), 
+        # LlamaParse already retries internally - keep ours short, jittered so
+        # Celery workers failing together don't retry in lockstep
+        stop=stop_after_attempt(3),
+        wait=wait_exponential_jitter(initial=2, max=30),
+        retry=(
+            retry_if_exception_type((httpx.TimeoutException, httpx.TransportError, ConnectionError))
+            | retry_if_exception(_is_retryable_status)
+            | retry_if_exception(_is_transient_message)
+        ),
         before_sleep=before_sleep_log(logger, logging.INFO)
     )
-    async def _parse_with_retry(self, parser, file_path_str):
-        """Helper to retry parsing on failure"""
-        return await parser.aload_data(file_path_str)
+    async def _parse_with_retry(self, parser, file_source, extra_info=None):
+        """Helper to retry parsing on transient failure (file_source: path or PDF bytes)"""
+        loop = asyncio.get_running_loop()
+        # The job deadline is the parser's max_timeout: a job that runs out of time fails
+        # inside its own thread (not retried), so no second billed parse starts while the
+        # first one is still running
+        return await loop.run_in_executor(
+            _PARSE_EXECUTOR, partial(parser.load_data, file_source, extra_info=extra_info)
+        )
+
+    def tag_ingested(self, s3_key):
+        """
+        Tags an S3 object as ingested (value = its ETag) after successful indexing.
+        Best effort: a tagging failure never fails the ingestion.
+        """
+        bucket_name = os.getenv("S3_BUCKET_NAME", "neel-rag-data-2026")
+        s3_key = str(s3_key).replace("\\", "/")
+        try:
+            etag = self._s3.head_object(Bucket=bucket_name, Key=s3_key)['ETag'].strip('"')
+            # put_object_tagging replaces the whole set, so keep unrelated tags
+            tags = [
+                t for t in self._s3.get_object_tagging(Bucket=bucket_name, Key=s3_key)['TagSet']
+                if t['Key'] != INGESTED_TAG
+            ]
+            tags.append({'Key': INGESTED_TAG, 'Value': etag})
+            self._s3.put_object_tagging(Bucket=bucket_name, Key=s3_key, Tagging={'TagSet': tags})
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(f"Could not tag {s3_key} as ingested: {e}")
+
+    def _is_tagged_ingested(self, bucket_name, s3_key, etag):
+        """True if the object carries the ingested tag for its current ETag."""
+        try:
+            tags = self._s3.get_object_tagging(Bucket=bucket_name, Key=s3_key)['TagSet']
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(f"Could not read tags for {s3_key}: {e}")
+            return False
+        return any(t['Key'] == INGESTED_TAG and t['Value'] == etag for t in tags)
 
     async def ingest_documents(self):
         """Producer: Scan files and Queue tasks"""
         # Local import to avoid circular dependency
-        from src.worker.tasks import process_document_task
+        from src.worker.tasks import process_document_task, process_document_batch_task
         
         bucket_name = os.getenv("S3_BUCKET_NAME", "neel-rag-data-2026")
         prefix = "raw/"
         
         try:
-            s3 = boto3.client(
-                's3',
-                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-                region_name=os.getenv("AWS_REGION", "us-east-1")
-            )
-            response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+            # Paginate - a single list_objects_v2 call silently stops at 1000 keys
+            paginator = self._s3.get_paginator('list_objects_v2')
+            pages = paginator.paginate(Bucket=bucket_name, Prefix=prefix, PaginationConfig={'PageSize': 1000})
             
-            # Filter only PDFs
-            files = [obj['Key'] for obj in response.get('Contents', []) if obj['Key'].lower().endswith('.pdf')]
+            # Filter only PDFs, keep ETag/Size for change detection
+            objects = {
+                obj['Key']: (obj.get('ETag', '').strip('"'), obj.get('Size'))
+                for page in pages
+                for obj in page.get('Contents', [])
+                if obj['Key'].lower().endswith('.pdf')
+            }
+            files = list(objects)
             
         except Exception as e:
             logger.error(f"❌ Failed to list S3 objects: {e}")
@@ -342,45 +789,111 @@ CRITICAL EXTRACTION REQUIREMENTS:
         queued_count = 0
         db = next(get_db())
         try:
-            for s3_key in files:
-                filename = Path(s3_key).name
-                
-                # Check DB Status
-                record = db.query(FileTracking).filter(FileTracking.filename == filename).first()
-                
-                # Logic: Queue if NOT exists OR if FAILED (retry)
-                # Skip if PENDING/PROCESSING/COMPLETED
-                should_queue = False
+            # One IN-query for all tracking rows instead of a SELECT per file
+            filenames = [Path(k).name for k in files]
+            existing = {
+                r.filename: r
+                for r in db.query(FileTracking).filter(FileTracking.filename.in_(filenames)).all()
+            }
+            
+            # Logic: Queue if NOT exists OR if FAILED (retry) OR COMPLETED but the
+            # S3 content changed (ETag). Skip if PENDING/PROCESSING/unchanged COMPLETED
+            keys_to_queue = []
+            new_records = []
+            now = datetime.utcnow()
+            # Tag lookups for untracked keys run concurrently - one GetObjectTagging
+            # round-trip each would otherwise be paid serially per key
+            tagged = set()
+            if self.config.get('s3', {}).get('tag_ingested', False):
+                untracked = [k for k, name in zip(files, filenames) if name not in existing]
+                if untracked:
+                    with ThreadPoolExecutor(max_workers=min(TAG_LOOKUP_THREADS, len(untracked))) as pool:
+                        flags = pool.map(
+                            lambda k: self._is_tagged_ingested(bucket_name, k, objects[k][0]), untracked
+                        )
+                        tagged = {k for k, flag in zip(untracked, flags) if flag}
+            for s3_key, filename in zip(files, filenames):
+                etag, size = objects[s3_key]
+                record = existing.get(filename)
                 if not record:
-                    should_queue = True
-                    record = FileTracking(filename=filename, status="PENDING")
-                    db.add(record)
-                elif record.status == "FAILED":
-                    should_queue = True
+                    if s3_key in tagged:
+                        # Tracking DB lost/reset but this exact object was already indexed
+                        new_records.append(FileTracking(filename=filename, status="COMPLETED", etag=etag, size=size))
+                        existing[filename] = new_records[-1]
+                        logger.info(f"ℹ️  Skipping {filename} (S3 tag: already ingested)")
+                        continue
+                    new_records.append(FileTracking(filename=filename, status="PENDING", etag=etag, size=size))
+                    # Guard against duplicate filenames under different S3 prefixes
+                    existing[filename] = new_records[-1]
+                    keys_to_queue.append(s3_key)
+                elif record.status == "FAILED" or (
+                    record.status == "COMPLETED" and record.etag and record.etag != etag
+                ):
+                    if record.status == "COMPLETED":
+                        logger.info(f"♻️  Content changed for {filename} (ETag {record.etag} -> {etag})")
                     record.status = "PENDING"
                     record.error_msg = None
-                    # Update timestamp
-                    record.updated_at = datetime.utcnow()
-                
-                if should_queue:
-                    db.commit() # Commit PENDING status
-                    
-                    # FIX #4: Sanitize broker URL before logging (prevent credential leak)
-                    from src.worker.celery_app import app
-                    broker_url = app.conf.broker_url
-                    # Hide password if present (redis://:password@host:port/db)
-                    broker_url_safe = broker_url.split('@')[-1] if '@' in broker_url else broker_url
-                    logger.info(f"DEBUG: Using Celery Broker: {broker_url_safe}")
-                    
-                    # Send to Celery
-                    process_document_task.delay(s3_key, self.config)
-                    logger.info(f"🚀 Queued: {filename}")
-                    queued_count += 1
+                    record.etag = etag
+                    record.size = size
+                    record.updated_at = now
+                    keys_to_queue.append(s3_key)
                 else:
+                    if record.status == "COMPLETED" and not record.etag:
+                        # Backfill rows tracked before ETags were recorded
+                        record.etag = etag
+                        record.size = size
                     logger.info(f"ℹ️  Skipping {filename} (Status: {record.status})")
+            
+            if new_records:
+                # Upsert-style claim: a row another producer/worker inserted since
+                # our SELECT is skipped (and not queued twice) instead of failing
+                # the whole batch on the primary key
+                inserted = insert_missing(db, FileTracking, [
+                    {'filename': r.filename, 'status': r.status, 'etag': r.etag,
+                     'size': r.size, 'created_at': now, 'updated_at': now}
+                    for r in new_records
+                ], key='filename')
+                lost = {r.filename for r in new_records} - inserted
+                if lost:
+                    logger.info(f"ℹ️  Skipping {len(lost)} file(s) tracked concurrently by another run")
+                    keys_to_queue = [k for k in keys_to_queue if Path(k).name not in lost]
+            if keys_to_queue or db.dirty or new_records:
+                db.commit() # Commit PENDING status (once for the whole batch)
+            
+            if keys_to_queue:
+                # FIX #4: Sanitize broker URL before logging (prevent credential leak)
+                from src.worker.celery_app import app
+                broker_url = app.conf.broker_url
+                # Hide password if present (redis://:password@host:port/db)
+                broker_url_safe = broker_url.split('@')[-1] if '@' in broker_url else broker_url
+                logger.info(f"DEBUG: Using Celery Broker: {broker_url_safe}")
+                
+                # Send to Celery as one group (amortizes broker round-trips). Skew staggers
+                # start times so workers don't all hit LlamaParse at once. Only the config
+                # sections the task reads are published (once, by content hash) and each
+                # message carries only the hash, to keep it small. Files go out in batches so
+                # a task's fixed costs and the embedding calls are shared by several files.
+                from src.core.config import publish_config, TASK_CONFIG_KEYS
+                task_config = {k: self.config[k] for k in TASK_CONFIG_KEYS if k in self.config}
+                cfg_hash = publish_config(task_config)
+                batch_size = self.config['parsing'].get('task_batch_size', 1)
+                if batch_size > 1:
+                    signatures = [
+                        process_document_batch_task.s(keys_to_queue[i:i + batch_size], cfg_hash)
+                        for i in range(0, len(keys_to_queue), batch_size)
+                    ]
+                else:
+                    signatures = [process_document_task.s(s3_key, cfg_hash) for s3_key in keys_to_queue]
+                group(signatures).skew(
+                    start=0, stop=len(signatures) * SKEW_STEP_SECONDS, step=SKEW_STEP_SECONDS
+                ).apply_async()
+                
+                queued_count = len(keys_to_queue)
+                logger.info(f"🚀 Queued: {', '.join(Path(k).name for k in keys_to_queue)}")
                     
         except Exception as e:
             logger.error(f"Error during queuing: {e}")
+            db.rollback()
         finally:
             db.close()
             
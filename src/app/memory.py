@@ -1,38 +1,81 @@
 import os
 import logging
+from functools import lru_cache
+from typing import List
+import orjson
+import redis
 from langchain_community.chat_message_histories import RedisChatMessageHistory
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    AIMessage,
+    message_to_dict,
+    messages_from_dict,
+)
 
 logger = logging.getLogger('app_logger')
 
+HISTORY_TTL = 3600  # 1 Hour TTL
+
+
+def _dumps_message(message: BaseMessage) -> bytes:
+    return orjson.dumps(message_to_dict(message), option=orjson.OPT_NON_STR_KEYS)
+
+
+class OrjsonRedisChatMessageHistory(RedisChatMessageHistory):
+    """
+    RedisChatMessageHistory with orjson (de)serialization - same stored JSON,
+    so existing sessions written with stdlib json keep loading.
+    """
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        items = self.redis_client.lrange(self.key, 0, -1)
+        return messages_from_dict([orjson.loads(m) for m in items[::-1]])
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.redis_client.lpush(self.key, _dumps_message(message))
+        if self.ttl:
+            self.redis_client.expire(self.key, self.ttl)
+
 class MemoryService:
     def __init__(self, redis_url=None):
         # Default to local docker redis if not specified
         self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        # One pooled client for every session instead of a new connection per call
+        self._pool = redis.ConnectionPool.from_url(self.redis_url, max_connections=32)
+        self._client = redis.Redis(connection_pool=self._pool)
+        self._history = lru_cache(maxsize=1024)(self._build_history)
+
+    def _build_history(self, session_id: str):
+        history = OrjsonRedisChatMessageHistory(session_id=session_id, url=self.redis_url, ttl=HISTORY_TTL)
+        history.redis_client = self._client
+        return history
+
+    def _append(self, session_id: str, message):
+        """LPUSH + TTL refresh in one round-trip (RedisChatMessageHistory sends two)."""
+        history = self._history(session_id)
+        pipe = self._client.pipeline(transaction=False)
+        pipe.lpush(history.key, _dumps_message(message))
+        pipe.expire(history.key, HISTORY_TTL)
+        pipe.execute()
 
     def get_history(self, session_id: str):
         """Returns the RedisChatMessageHistory object (List of Messages)"""
         try:
-            history = RedisChatMessageHistory(
-                session_id=session_id, 
-                url=self.redis_url,
-                ttl=3600 # 1 Hour TTL
-            )
-            return history.messages
+            return self._history(session_id).messages
         except Exception as e:
             logger.error(f"Failed to fetch history for {session_id}: {e}")
             return []
 
     def add_user_message(self, session_id: str, message: str):
         try:
-            history = RedisChatMessageHistory(session_id=session_id, url=self.redis_url, ttl=3600)
-            history.add_user_message(message)
+            self._append(session_id, HumanMessage(content=message))
         except Exception as e:
             logger.error(f"Failed to add user message: {e}")
 
     def add_ai_message(self, session_id: str, message: str):
         try:
-            history = RedisChatMessageHistory(session_id=session_id, url=self.redis_url, ttl=3600)
-            history.add_ai_message(message)
+            self._append(session_id, AIMessage(content=message))
         except Exception as e:
             logger.error(f"Failed to add AI message: {e}")
@@ -3,6 +3,7 @@ Page Classifier - Detect chart/table heavy pages for Vision API processing
 """
 
 import re
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Tuple
 
 class PageComplexityClassifier:
@@ -21,6 +22,19 @@ class PageComplexityClassifier:
         'tabell', 'table', 'tab.', 'übersicht', 'liste'
     ]
     
+    # Compiled once - classify_page runs for every page of every PDF.
+    # One case-insensitive alternation scan per keyword list; pages are only
+    # lower()-ed to pick the reported keyword when the scan matches.
+    NUMBER_PATTERN = re.compile(r'\d+')
+    CHART_PATTERN = re.compile('|'.join(map(re.escape, CHART_KEYWORDS)), re.IGNORECASE)
+    TABLE_PATTERN = re.compile('|'.join(map(re.escape, TABLE_KEYWORDS)), re.IGNORECASE)
+    
+    # Bump whenever scoring rules change - invalidates persisted classification caches
+    VERSION = "3"
+    
+    # Smallest batch worth spreading over a process pool
+    PARALLEL_MIN_PAGES = 50
+    
     def __init__(self, complexity_threshold: int = 4):
         """
         Args:
@@ -29,6 +43,19 @@ class PageComplexityClassifier:
         """
         self.threshold = complexity_threshold
     
+    @staticmethod
+    def _first_keyword(page_content, pattern, keywords):
+        """
+        First keyword in list order that the page contains, or None. The fused pattern
+        only answers "any keyword?"; list order decides which one is reported, because
+        the reason string (e.g. 'table' vs 'figure') picks the Vision chart_type.
+        """
+        match = pattern.search(page_content)
+        if not match:
+            return None
+        content_lower = page_content.lower()
+        return next((k for k in keywords if k in content_lower), match.group(0).lower())
+    
     def classify_page(
         self, 
         page_content: str, 
@@ -51,35 +78,25 @@ class PageComplexityClassifier:
         reasons = []
         
         page_metadata = page_metadata or {}
-        content_lower = page_content.lower()
         
         # Check 1: Metadata indicates table
         if page_metadata.get('has_table', False):
             score += 3
             reasons.append("Metadata: Table detected")
         
-        # Check 2: Chart keywords present
-        chart_found = False
-        for keyword in self.CHART_KEYWORDS:
-            if keyword in content_lower:
-                score += 2
-                chart_found = True
-                reasons.append(f"Keyword: '{keyword}'")
-                break
-        
-        # Check 3: Table keywords
-        if not chart_found:
-            for keyword in self.TABLE_KEYWORDS:
-                if keyword in content_lower:
-                    score += 2
-                    reasons.append(f"Keyword: '{keyword}'")
-                    break
+        # Check 2: Chart keywords present (Check 3: else table keywords)
+        keyword = self._first_keyword(page_content, self.CHART_PATTERN, self.CHART_KEYWORDS)
+        if keyword is None:
+            keyword = self._first_keyword(page_content, self.TABLE_PATTERN, self.TABLE_KEYWORDS)
+        if keyword:
+            score += 2
+            reasons.append(f"Keyword: '{keyword}'")
         
         # Check 4: High number-to-text ratio (indicates data/chart)
-        numbers = re.findall(r'\d+', page_content)
-        words = page_content.split()
-        if len(words) > 0:
-            number_ratio = len(numbers) / len(words)
+        number_count = len(self.NUMBER_PATTERN.findall(page_content))
+        word_count = len(page_content.split())
+        if word_count > 0:
+            number_ratio = number_count / word_count
             if number_ratio > 0.25:  # >25% numbers
                 score += 2
                 reasons.append(f"High numeric content ({number_ratio:.0%})")
@@ -109,33 +126,39 @@ class PageComplexityClassifier:
     
     def classify_batch(
         self, 
-        pages: List[Dict]
+        pages: List[Dict],
+        num_workers: int = None
     ) -> Dict[int, Dict]:
         """
         Classify multiple pages
         
         Args:
             pages: List of dicts with 'page_number', 'content', 'metadata'
+            num_workers: Classify in a process pool of this size (CPU-bound regex
+                         work). Batches under PARALLEL_MIN_PAGES stay serial since
+                         pool start-up would cost more than it saves.
         
         Returns:
             Dict mapping page_number -> {classification, score, reason}
         """
-        results = {}
-        
-        for page in pages:
-            page_num = page.get('page_number', 0)
-            content = page.get('content', '')
-            metadata = page.get('metadata', {})
-            
-            classification, score, reason = self.classify_page(content, metadata)
-            
-            results[page_num] = {
+        page_nums = [page.get('page_number', 0) for page in pages]
+        contents = [page.get('content', '') for page in pages]
+        metadatas = [page.get('metadata', {}) for page in pages]
+        
+        if num_workers and num_workers > 1 and len(pages) >= self.PARALLEL_MIN_PAGES:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                outcomes = list(executor.map(self.classify_page, contents, metadatas, chunksize=32))
+        else:
+            outcomes = map(self.classify_page, contents, metadatas)
+        
+        return {
+            page_num: {
                 'classification': classification,
                 'score': score,
                 'reason': reason
             }
-        
-        return results
+            for page_num, (classification, score, reason) in zip(page_nums, outcomes)
+        }
     
     def get_statistics(self, classifications: Dict[int, Dict]) -> Dict:
         """
@@ -4,25 +4,128 @@ Uses pytesseract OSD to detect page rotation and auto-corrects it
 """
 
 import os
+import shelve
+import hashlib
 import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from PIL import Image
 import fitz  # PyMuPDF
 import pytesseract
 import logging
 
+# Optional: tesserocr keeps one in-process Tesseract (OSD model loaded once)
+# instead of spawning the tesseract binary for every page
+try:
+    from tesserocr import PyTessBaseAPI, PSM
+except ImportError:
+    PyTessBaseAPI = None
+
 logger = logging.getLogger('app_logger')
 
+# Per-process tesserocr handle (False = unavailable, don't retry)
+_tess_api = None
+
+
+def _get_tess_api():
+    global _tess_api
+    if _tess_api is None:
+        _tess_api = False
+        if PyTessBaseAPI is not None:
+            try:
+                # OSD needs the legacy osd model, so keep the default engine mode
+                _tess_api = PyTessBaseAPI(psm=PSM.OSD_ONLY)
+            except Exception as e:
+                logger.warning(f"tesserocr unavailable ({e}), using pytesseract")
+    return _tess_api or None
+
+
+def _page_image(page, dpi=72, max_side=1000):
+    """
+    Render a page straight into a grayscale PIL image for OSD.
+    Wraps the pixmap samples directly (no PNG encode/decode round-trip);
+    OSD only needs luma, so gray is a third of the RGB buffer. Oversized
+    pages (large formats) are downscaled to max_side - orientation needs
+    a few legible glyphs, not full resolution.
+    """
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    pix = None  # frombytes copied the samples; free the pixmap before any resize
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+    return image
+
+
+def _has_upright_text(page, min_chars=50):
+    """
+    True if the page has a real text layer that reads left-to-right upright.
+    Born-digital pages like this need no OSD; scanned pages (no text layer) and
+    pages with sideways/upside-down text return False and go through OSD.
+    """
+    if page.rotation:
+        return False
+    upright = total = 0
+    for block in page.get_text("dict", flags=0)["blocks"]:
+        for line in block.get("lines", ()):
+            chars = sum(len(span["text"].strip()) for span in line["spans"])
+            total += chars
+            if line["dir"][0] > 0.99:  # Unit writing direction ~(1, 0)
+                upright += chars
+    return total >= min_chars and upright >= 0.9 * total
+
+
+def _init_osd_worker(tesseract_cmd):
+    # Spawned workers (Windows) don't inherit the tesseract path set in the parent
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _osd_rotation(image):
+    """
+    Rotation angle from Tesseract OSD, or None if OSD fails (runs in a worker process)
+    """
+    try:
+        api = _get_tess_api()
+        if api is not None:
+            api.SetImage(image)
+            result = api.DetectOrientationScript()
+            if not result:
+                return None
+            # Same convention as the "Rotate:" line of tesseract's OSD output
+            return (360 - result['orient_deg']) % 360
+        
+        # Get orientation and script detection
+        osd = pytesseract.image_to_osd(image)
+        # Parse rotation angle
+        return int([line for line in osd.split('\n') if 'Rotate' in line][0].split(':')[1].strip())
+    except Exception as e:
+        logger.debug(f"OSD detection failed: {e}")
+        return None
+
+
 class PDFRotationCorrector:
     """
     Detects and corrects rotated pages in PDF before parsing
     """
     
-    def __init__(self, tesseract_path=None):
+    # Below this many pages, process-pool start-up costs more than parallel OSD saves
+    PARALLEL_MIN_PAGES = 4
+    
+    # Concurrent Gemini fallback calls per PDF (stay under the API's QPM limit)
+    GEMINI_CONCURRENCY = 8
+    
+    def __init__(self, tesseract_path=None, osd_dpi=72, cache_dir=None):
         """
         Args:
             tesseract_path: Path to tesseract executable (Windows: C:/Program Files/Tesseract-OCR/tesseract.exe)
+            osd_dpi: Render resolution for OSD (raise for documents with very small print)
+            cache_dir: Directory for persisted OSD results (defaults to env ROTATION_CACHE_DIR)
         """
+        self.osd_dpi = osd_dpi
+        
+        # OSD results are persisted by page-image hash so re-ingesting an
+        # unchanged PDF doesn't re-OCR every page
+        self.cache_dir = Path(cache_dir or os.getenv('ROTATION_CACHE_DIR', 'data/cache'))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
         if tesseract_path:
             pytesseract.pytesseract.tesseract_cmd = tesseract_path
     
@@ -31,27 +134,30 @@ class PDFRotationCorrector:
         Detect rotation angle using Tesseract OSD, falling back to Gemini Vision
         """
         # Try Tesseract First
-        try:
-            # Get orientation and script detection
-            osd = pytesseract.image_to_osd(image)
-            # Parse rotation angle
-            rotation = int([line for line in osd.split('\n') if 'Rotate' in line][0].split(':')[1].strip())
+        rotation = _osd_rotation(image)
+        if rotation is not None:
             return rotation
-        except Exception as e:
-            # Fallback to Gemini Vision if configured
-            api_key = os.getenv("GOOGLE_API_KEY")
-            if api_key:
-                return self.detect_rotation_with_gemini(image, api_key)
-            
-            logger.warning(f"OSD detection failed and no Gemini API key: {e}. Assuming 0° rotation.")
-            return 0
+        return self._fallback_rotation(image)
 
-    def detect_rotation_with_gemini(self, image, api_key):
-        """Uses Gemini Flash to detect page rotation"""
+    def _fallback_rotation(self, image):
+        """Gemini Vision if configured, else assume upright"""
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if api_key:
+            return self.detect_rotation_with_gemini(image, api_key)
+        
+        logger.warning("OSD detection failed and no Gemini API key. Assuming 0° rotation.")
+        return 0
+
+    @staticmethod
+    def _gemini_model(api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel('gemini-2.5-flash')
+
+    def detect_rotation_with_gemini(self, image, api_key, model=None):
+        """Uses Gemini Flash to detect page rotation (model: reuse a configured client)"""
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
+            model = model or self._gemini_model(api_key)
             
             # Downscale for speed/cost
             img_small = image.resize((512, 512))
@@ -91,6 +197,86 @@ class PDFRotationCorrector:
             logger.debug(f"Gemini rotation check failed: {e}")
             return 0
 
+    def _image_key(self, image):
+        """Content fingerprint of a rendered page (pixels + render settings)."""
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+        digest.update(f"{image.size}|{self.osd_dpi}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _detect_rotations(self, images):
+        """
+        Rotation per rendered page: OSD results cache -> Tesseract OSD -> Gemini.
+        
+        Pages whose pixels repeat (blank pages, shared templates) are OSD'd once,
+        and OSD results persist across runs so re-ingesting a PDF skips OCR.
+        Gemini answers aren't persisted - they fall back to 0 on API errors.
+        
+        images may be a lazy iterable: each page is fingerprinted as it arrives and
+        only kept in memory if it still needs OSD.
+        """
+        keys = []
+        rotations = {}
+        
+        try:
+            cache = shelve.open(str(self.cache_dir / 'osd_rotation'))
+        except Exception as e:
+            logger.warning(f"OSD cache unavailable ({e}), running OSD for every page")
+            cache = {}
+        
+        try:
+            # First page for each uncached fingerprint
+            todo = {}
+            for image in images:
+                key = self._image_key(image)
+                keys.append(key)
+                if key in rotations or key in todo:
+                    continue
+                cached = cache.get(key)
+                if cached is not None:
+                    rotations[key] = cached
+                else:
+                    todo[key] = image
+            
+            # OSD is a tesseract subprocess per page - run pages across cores
+            todo_keys, todo_images = list(todo), list(todo.values())
+            if len(todo_images) >= self.PARALLEL_MIN_PAGES:
+                with ProcessPoolExecutor(
+                    max_workers=min(len(todo_images), os.cpu_count() or 1),
+                    initializer=_init_osd_worker,
+                    initargs=(pytesseract.pytesseract.tesseract_cmd,)
+                ) as executor:
+                    osd_results = list(executor.map(_osd_rotation, todo_images, chunksize=4))
+            else:
+                osd_results = [_osd_rotation(image) for image in todo_images]
+            
+            for key, rotation in zip(todo_keys, osd_results):
+                if rotation is not None:
+                    rotations[key] = rotation
+                    cache[key] = rotation
+            
+            if todo:
+                logger.info(f"OSD cache: {len(keys) - len(todo)} pages reused, {len(todo)} OSD runs")
+        finally:
+            if hasattr(cache, 'close'):
+                cache.close()
+        
+        # Gemini fallback for pages OSD couldn't read: network-bound, so one
+        # configured model and concurrent requests instead of one call at a time
+        pending = [key for key in todo_keys if key not in rotations]
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if pending and api_key:
+            model = self._gemini_model(api_key)
+            with ThreadPoolExecutor(max_workers=min(len(pending), self.GEMINI_CONCURRENCY)) as executor:
+                fallback = executor.map(
+                    lambda key: self.detect_rotation_with_gemini(todo[key], api_key, model), pending
+                )
+                for key, rotation in zip(pending, fallback):
+                    rotations[key] = rotation
+        elif pending:
+            logger.warning(f"OSD detection failed on {len(pending)} pages and no Gemini API key. Assuming 0° rotation.")
+        
+        return [rotations.get(key, 0) for key in keys]
+
     def process_pdf(self, pdf_path, output_path=None):
         """
         Process entire PDF: detect rotated pages and create corrected version
@@ -103,36 +289,40 @@ class PDFRotationCorrector:
                 output_fd, output_path = tempfile.mkstemp(suffix=".pdf")
                 os.close(output_fd)
             
-            corrected_doc = fitz.open()  # New empty PDF
-            
             rotated_pages = []
             
             # Limit pages to process to avoid massive API costs/time for huge docs?
             # Report 32 is ~50 pages. Acceptable.
             
-            for page_num in range(len(doc)):
+            # Born-digital pages with upright text need no OSD - a text-layer query
+            # is ~1ms versus a render + Tesseract run
+            to_check = [page.number for page in doc if not _has_upright_text(page)]
+            if len(to_check) < len(doc):
+                logger.info(f"Skipping OSD on {len(doc) - len(to_check)}/{len(doc)} pages with an upright text layer")
+            
+            # Phase 1: render pages here (fitz.Document can't be shared across processes),
+            # lazily - pages answered from the OSD cache are dropped right after hashing
+            detected = self._detect_rotations(_page_image(doc[i], dpi=self.osd_dpi) for i in to_check) if to_check else []
+            rotations = [0] * len(doc)
+            for page_num, rotation in zip(to_check, detected):
+                rotations[page_num] = rotation
+            
+            for page_num, rotation in enumerate(rotations):
                 page = doc[page_num]
                 
-                # Convert page to image for OSD
-                pix = page.get_pixmap(dpi=150)
-                img_data = pix.tobytes("png")
-                
-                # Open with PIL
-                from io import BytesIO
-                image = Image.open(BytesIO(img_data))
-                
-                # Detect rotation
-                rotation = self.detect_page_rotation(image)
-                
                 if rotation != 0:
                     rotated_pages.append((page_num + 1, rotation))
                     page.set_rotation((page.rotation - rotation) % 360)
-                
-                corrected_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
             
-            corrected_doc.save(output_path)
-            corrected_doc.close()
+            # Rotation is a page-dictionary edit on doc itself - save it once
+            # (no copy of every page into a second document)
+            if Path(output_path).resolve() == Path(pdf_path).resolve():
+                if rotated_pages:
+                    doc.saveIncr()
+            else:
+                doc.save(output_path)
             doc.close()
+            fitz.TOOLS.store_shrink(100)  # Release MuPDF's cached render resources
             
             if rotated_pages:
                 logger.info(f"✅ Corrected {len(rotated_pages)} rotated pages using Hybrid (Tesseract/Gemini): {rotated_pages}")
@@ -156,13 +346,7 @@ def test_rotation_detection(pdf_path):
     
     # Test first 3 pages
     for i in range(min(3, len(doc))):
-        page = doc[i]
-        pix = page.get_pixmap(dpi=150)
-        img_data = pix.tobytes("png")
-        
-        from io import BytesIO
-        from PIL import Image
-        image = Image.open(BytesIO(img_data))
+        image = _page_image(doc[i], dpi=corrector.osd_dpi)
         
         rotation = corrector.detect_page_rotation(image)
         print(f"Page {i+1}: {rotation}° rotation detected")
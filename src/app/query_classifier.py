@@ -90,6 +90,15 @@ class QueryClassifier:
             r'can you',  # "Can you help?" vs "Can you find..."
             r'help me',  # Ambiguous intent
         ]
+        
+        # Compiled once - classify() runs on every user query
+        self._knowledge_set = frozenset(self.knowledge_indicators)
+        # All strict patterns share the same ^...\.?$ framing, so fuse them into one alternation
+        strict_bodies = (p[1:-len(r'\.?$')] for p in self.strict_generic_patterns)
+        self._strict_re = re.compile(r'^(?:' + '|'.join(strict_bodies) + r')\.?$', re.IGNORECASE)
+        self._ambiguous_res = [re.compile(p, re.IGNORECASE) for p in self.ambiguous_patterns]
+        self._punct_re = re.compile(r'[^\w\s]')
+        self._trailing_punct_re = re.compile(r'[!.]+$')
     
     def classify(self, query: str) -> QueryType:
         """
@@ -104,7 +113,7 @@ class QueryClassifier:
         
         # Normalize for comparison
         q = query.lower().strip()
-        q_clean = re.sub(r'[^\w\s]', '', q)
+        q_clean = self._punct_re.sub('', q)
         words = q_clean.split()
         
         # SAFETY CHECK 1: Question mark → ALWAYS knowledge (even "hi?")
@@ -112,34 +121,25 @@ class QueryClassifier:
             logger.info(f"Query '{query}' contains '?' → knowledge")
             return 'knowledge'
         
-        # Remove trailing punctuation for pattern matching (after ?  check)
-        q_for_match = re.sub(r'[!.]+$', '', q).strip()
-        
-        # SAFETY CHECK 2: Exact pattern match required for 'generic'
-        is_strict_generic = any(
-            re.match(pattern, q_for_match, re.IGNORECASE) 
-            for pattern in self.strict_generic_patterns
-        )
-        
-        if is_strict_generic:
-            # Even if pattern matches, double-check for knowledge indicators
-            if self._has_knowledge_indicators(q_clean):
-                logger.info(f"Query '{query}' matched generic pattern but has knowledge indicators → knowledge")
-                return 'knowledge'
-            
-            logger.info(f"Query '{query}' classified as generic (exact match)")
-            return 'generic'
-        
-        # SAFETY CHECK 3: Any knowledge indicator → retrieval
-        if self._has_knowledge_indicators(q_clean):
+        # SAFETY CHECK 2: Any knowledge indicator → retrieval
+        # (also overrides a generic pattern match, so test it before any regex work)
+        if self._has_knowledge_indicators(words):
             logger.info(f"Query '{query}' has knowledge indicators → knowledge")
             return 'knowledge'
         
-        # SAFETY CHECK 4: Multiple words without generic pattern → knowledge
+        # SAFETY CHECK 3: Multiple words → knowledge (no generic pattern is longer than 2 words)
         if len(words) > 2:
             logger.info(f"Query '{query}' is multi-word, not matched → knowledge")
             return 'knowledge'
         
+        # Remove trailing punctuation for pattern matching (after ?  check)
+        q_for_match = self._trailing_punct_re.sub('', q).strip()
+        
+        # SAFETY CHECK 4: Exact pattern match required for 'generic'
+        if self._strict_re.match(q_for_match):
+            logger.info(f"Query '{query}' classified as generic (exact match)")
+            return 'generic'
+        
         # SAFETY CHECK 5: Check for ambiguous patterns
         if self._is_ambiguous(q):
             logger.info(f"Query '{query}' is ambiguous → knowledge (safe default)")
@@ -149,19 +149,14 @@ class QueryClassifier:
         logger.info(f"Query '{query}' uncertain → knowledge (conservative default)")
         return 'knowledge'
     
-    def _has_knowledge_indicators(self, query_normalized: str) -> bool:
-        """Check if query contains ANY knowledge-seeking indicators"""
-        return any(
-            indicator in query_normalized.split()
-            for indicator in self.knowledge_indicators
-        )
+    def _has_knowledge_indicators(self, query_normalized) -> bool:
+        """Check if query (string or already-split words) contains ANY knowledge-seeking indicators"""
+        words = query_normalized.split() if isinstance(query_normalized, str) else query_normalized
+        return not self._knowledge_set.isdisjoint(words)
     
     def _is_ambiguous(self, query_normalized: str) -> bool:
         """Check if query matches ambiguous patterns"""
-        return any(
-            re.search(pattern, query_normalized, re.IGNORECASE)
-            for pattern in self.ambiguous_patterns
-        )
+        return any(pattern.search(query_normalized) for pattern in self._ambiguous_res)
     
     def classify_with_confidence(self, query: str) -> tuple[QueryType, float]:
         """
@@ -1,17 +1,33 @@
+import hashlib
 import logging
 import os
 import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from functools import lru_cache, partial
 import boto3
+import orjson
 from typing import Iterator, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
 from langchain_core.stores import ByteStore
 from langchain_qdrant import QdrantVectorStore, FastEmbedSparse
 from qdrant_client import QdrantClient, models
 from src.app.embedding import EmbeddingService
 from src.core.vector_store import get_qdrant_client
 import cohere  # Multilingual reranker
-from langchain_google_genai import ChatGoogleGenerativeAI
+from src.core.llm import get_chat_model
 from langchain_core.prompts import PromptTemplate
 
+# Optional: zstd-compressed parent documents (smaller S3 GETs and Redis entries)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Parent-Child Dependencies
 print("DEBUG: Importing ParentDocumentRetriever...")
 try:
@@ -47,6 +63,187 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 logger = logging.getLogger('app_logger')
 
+# Cohere relevance scores keyed by (query, passage) - top parents resurface across turns
+RERANK_MODEL = "rerank-multilingual-v3.0"
+UPSERT_BATCH_SIZE = 64
+# Texts per dense-embedding request (batchEmbedContents accepts at most 100)
+EMBED_BATCH_SIZE = 100
+# Embedding requests in flight per add_documents call
+EMBED_CONCURRENCY = 4
+
+# In-process L1 in front of Redis for parent documents
+L1_CACHE_SIZE = 2048
+L1_TTL_SECONDS = 300
+
+# Speculative original-query searches that overlap the rewrite LLM call
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative")
+
+# Query rewriter prompt (chain built once per RetrievalService)
+REWRITE_PROMPT_TEMPLATE = """You are an expert RAG query processor. 
+                Your goal is to REWRITE the user's query into a STANDALONE technical query that effectively searches a Vector Database.
+
+                **PHASE 1: CONTEXT RESOLUTION (CRITICAL)**
+                - Use the CHAT HISTORY to resolve pronouns (e.g., "it", "this", "that report", "the previous answer").
+                - If the user asks "How did you conclude this?" or "Why?", you MUST rewrite it to: "Reasoning for [Specific Claim from previous Assistant Answer]".
+                - Example:
+                    History: (Assistant: The noise limit is 45 dB.)
+                    User: "Where is this mentioned?"
+                    Rewritten: "Source of 45 dB noise limit in the documents"
+
+                **PHASE 2: TRANSLATION & EXPANSION**
+                - The documents are Multilingual (Swedish/German/English). 
+                - Translate KEY technical terms into ALL 3 languages using OR logic.
+                - Example: "Noise" -> "Noise OR buller OR Lärm"
+
+                **PHASE 3: METADATA EXTRACTION**
+                - If a specific filename is mentioned (e.g. "Nordborg"), extract it as a filter.
+                
+                **Rules:**
+                - Return strictly JSON: {{"query": "final rewritten text", "filter": {{"key": "value"}} or null}}
+                - Do NOT answer the question. Just rewrite.
+                
+                Chat History:
+                {history}
+                
+                Current User Query: {query}
+                JSON Output:"""
+
+# Gemini query rewrites memoized in Redis by (prompt, query, recent history)
+REWRITE_CACHE_PREFIX = "qr:"
+REWRITE_CACHE_TTL = 3600
+
+# Parent docstore location. PARENT_STORE_BUCKET can point at an S3 Express One Zone
+# directory bucket (single-digit ms GETs); it defaults to the main data bucket.
+PARENT_STORE_PREFIX = "parent_store/"
+PARENT_CACHE_TTL = int(os.getenv("PARENT_CACHE_TTL", "86400"))  # Redis copy; can be shorter on Express
+
+
+def _parent_store_bucket():
+    return os.getenv("PARENT_STORE_BUCKET") or os.getenv("S3_BUCKET_NAME", "neel-rag-data-2026")
+
+
+# Concurrent S3 GETs per S3Store (the boto3 client's connection pool is sized to match)
+S3_FETCH_CONCURRENCY = int(os.getenv("S3_FETCH_CONCURRENCY", "32"))
+S3_DELETE_BATCH_SIZE = 1000
+RERANK_CACHE_SIZE = 4096
+_RERANK_CACHE = OrderedDict()
+_RERANK_CACHE_LOCK = threading.Lock()
+
+
+# Qdrant/bm25 sparse vectors carry term frequencies only; the IDF modifier makes Qdrant
+# apply corpus-level IDF at query time from its own collection statistics.
+SPARSE_VECTORS_CONFIG = {
+    "text-sparse": models.SparseVectorParams(
+        index=models.SparseIndexParams(on_disk=True),  # Keeps RAM for the dense HNSW graph
+        modifier=models.Modifier.IDF,
+    )
+}
+
+# Dense child vectors: originals on disk, int8 copies in RAM for search (rescored on originals)
+VECTORS_CONFIG = models.VectorParams(
+    size=768,
+    distance=models.Distance.COSINE,
+    on_disk=True,
+    hnsw_config=models.HnswConfigDiff(m=16, ef_construct=128),
+    quantization_config=models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+    ),
+)
+
+
+@lru_cache(maxsize=None)
+def _get_sparse_embeddings(cache_dir):
+    """One BM25 model per process, warmed so the first query doesn't pay the load."""
+    sparse = FastEmbedSparse(model_name="Qdrant/bm25", cache_dir=cache_dir)
+    sparse.embed_query("warmup")
+    return sparse
+
+
+@lru_cache(maxsize=None)
+def _get_cohere_client(api_key):
+    """Shared Cohere client so every RetrievalService reuses one HTTP connection pool."""
+    return cohere.Client(api_key=api_key)
+
+
+# Collections whose schema/payload indexes were checked by this process
+_QDRANT_READY = set()
+
+# Query text -> (dense, sparse) vectors
+QUERY_VECTOR_CACHE_SIZE = 1024
+_QUERY_VECTOR_CACHE = OrderedDict()
+_QUERY_VECTOR_CACHE_LOCK = threading.Lock()
+
+# Parent blobs written compressed start with this tag; untagged blobs are uncompressed
+ZSTD_MAGIC = b"ZST1"
+# Version byte of orjson-encoded parents (pickle payloads start with b"\x80" instead)
+PARENT_JSON_V1 = b"\x01"
+_zstd_local = threading.local()  # zstd (de)compressor objects aren't safe to share across threads
+
+
+def _zstd():
+    if not hasattr(_zstd_local, "compressor"):
+        _zstd_local.compressor = zstandard.ZstdCompressor(level=3)
+        _zstd_local.decompressor = zstandard.ZstdDecompressor()
+    return _zstd_local.compressor, _zstd_local.decompressor
+
+
+def _encode_parent(obj) -> bytes:
+    """Documents as versioned orjson (no class metadata, no pickle on read); anything else pickled."""
+    try:
+        if not isinstance(obj, Document):
+            raise TypeError(type(obj).__name__)
+        data = PARENT_JSON_V1 + orjson.dumps(
+            {"page_content": obj.page_content, "metadata": obj.metadata},
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+    except TypeError:  # Non-Document value or metadata orjson can't represent
+        data = pickle.dumps(obj)
+    if zstandard is None:
+        return data
+    return ZSTD_MAGIC + _zstd()[0].compress(data)
+
+
+def _decode_parent(data):
+    if not data:
+        return None
+    if data[:len(ZSTD_MAGIC)] == ZSTD_MAGIC:
+        data = _zstd()[1].decompress(data[len(ZSTD_MAGIC):])
+    if data[:1] == PARENT_JSON_V1:
+        doc = orjson.loads(data[1:])
+        return Document(page_content=doc["page_content"], metadata=doc["metadata"])
+    return pickle.loads(data)  # Parents written before the orjson format
+
+
+@lru_cache(maxsize=None)
+def _get_s3_client():
+    """
+    Process-wide S3 client for the parent docstore: credentials are resolved and the
+    urllib3 pool warmed once, not per RetrievalService (boto3 clients are thread-safe).
+    """
+    from botocore.config import Config
+    
+    s3_config = Config(
+        max_pool_connections=max(50, S3_FETCH_CONCURRENCY),
+        retries={'max_attempts': 3},
+        tcp_keepalive=True,
+    )
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION", "us-east-1"),
+        use_ssl=True,
+        config=s3_config
+    )
+
+
+def _text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).digest()
+
+
+def _passage_key(doc):
+    return _text_key(f"{doc.metadata.get('source', '')}\x00{doc.page_content}")
+
 class S3Store(ByteStore):
     """Custom ByteStore implementation for AWS S3"""
     def __init__(self, bucket_name: str, prefix: str = "", client=None, redis_url: str = "redis://localhost:6379/0"):
@@ -54,6 +251,19 @@ class S3Store(ByteStore):
         self.prefix = prefix
         self.client = client or boto3.client('s3')
         
+        # L1: key -> (expires_at, bytes), LRU-ordered. The short TTL bounds staleness
+        # when another process rewrites a parent.
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+        
+        # One pool for the store's lifetime: a cold mget of candidate_k parents issues all
+        # GETs at once instead of building a 10-thread pool per call
+        self._executor = ThreadPoolExecutor(max_workers=S3_FETCH_CONCURRENCY, thread_name_prefix="s3store")
+        
+        # In-flight S3 GETs by key (single-flight)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        
         # Redis Cache Initialization
         import redis
         try:
@@ -66,91 +276,172 @@ class S3Store(ByteStore):
 
     def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
         results = [None] * len(keys)
-        keys_to_fetch_from_s3 = []
+        
+        # 0. In-process L1 (hot parents skip the Redis round-trip entirely)
         indices_to_fetch = []
+        for i, key in enumerate(keys):
+            data = self._l1_get(key)
+            if data is not None:
+                results[i] = data
+            else:
+                indices_to_fetch.append(i)
+        
+        if not indices_to_fetch:
+            return results
+        
+        keys_to_fetch_from_s3 = []
+        s3_indices = []
 
         # 1. Check Redis Cache
         if self.use_redis:
             try:
                 # Batch get from Redis
                 # Prefix keys in Redis to avoid collisions
-                redis_keys = [f"parent_doc:{k}" for k in keys]
+                redis_keys = [f"parent_doc:{keys[i]}" for i in indices_to_fetch]
                 cached_values = self.redis.mget(redis_keys)
                 
-                for i, val in enumerate(cached_values):
+                for i, val in zip(indices_to_fetch, cached_values):
                     if val is not None:
                         results[i] = val
+                        self._l1_put(keys[i], val)
                     else:
                         keys_to_fetch_from_s3.append(keys[i])
-                        indices_to_fetch.append(i)
+                        s3_indices.append(i)
             except Exception as e:
                 # Redis failure fallback
                 print(f"⚠️ Redis read failed: {e}")
-                keys_to_fetch_from_s3 = list(keys)
-                indices_to_fetch = list(range(len(keys)))
+                keys_to_fetch_from_s3 = [keys[i] for i in indices_to_fetch]
+                s3_indices = list(indices_to_fetch)
         else:
-             keys_to_fetch_from_s3 = list(keys)
-             indices_to_fetch = list(range(len(keys)))
+             keys_to_fetch_from_s3 = [keys[i] for i in indices_to_fetch]
+             s3_indices = list(indices_to_fetch)
 
         if not keys_to_fetch_from_s3:
             return results
 
-        # 2. Fetch Missing from S3 (Parallel)
-        from concurrent.futures import ThreadPoolExecutor
-        
-        def fetch_s3_and_cache_redis(idx_key_tuple):
-            idx, key = idx_key_tuple
-            full_key = self.prefix + key
-            try:
-                response = self.client.get_object(Bucket=self.bucket_name, Key=full_key)
-                data = response['Body'].read()
-                
-                # Cache in Redis (Async/Fire-and-forget ideally, but blocking here needed for now)
-                # Set TTL to 24 hours (86400 seconds)
-                if self.use_redis:
-                    try:
-                        self.redis.setex(f"parent_doc:{key}", 86400, data)
-                    except Exception:
-                        pass 
-
-                return idx, data
-            except Exception:
-                return idx, None
-
-        with ThreadPoolExecutor(max_workers=10) as executor:  # Optimized: reduced from 50 to 10
-            fetched_results = list(executor.map(fetch_s3_and_cache_redis, zip(indices_to_fetch, keys_to_fetch_from_s3)))
+        # 2. Fetch Missing from S3 (Parallel, on the store's long-lived pool)
+        fetched_results = zip(s3_indices, self._executor.map(self._fetch_once, keys_to_fetch_from_s3))
             
         # 3. Merge Results
+        fetched = {}
         for idx, data in fetched_results:
             results[idx] = data
+            if data is not None:
+                fetched[keys[idx]] = data
+                self._l1_put(keys[idx], data)
+        
+        # 4. Back-fill Redis in one pipelined round-trip (TTL PARENT_CACHE_TTL)
+        self._redis_setex_many(fetched.items())
             
         return results
 
+    def _redis_setex_many(self, key_value_pairs) -> None:
+        if not self.use_redis:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, value in key_value_pairs:
+                pipe.setex(f"parent_doc:{key}", PARENT_CACHE_TTL, value)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Redis write failed: {e}")
+
+    def _l1_get(self, key: str) -> Optional[bytes]:
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return data
+
+    def _l1_put(self, key: str, data: bytes) -> None:
+        with self._l1_lock:
+            self._l1[key] = (time.monotonic() + L1_TTL_SECONDS, data)
+            self._l1.move_to_end(key)
+            while len(self._l1) > L1_CACHE_SIZE:
+                self._l1.popitem(last=False)
+
+    def _l1_discard(self, keys) -> None:
+        with self._l1_lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _fetch_s3(self, key: str) -> Optional[bytes]:
+        full_key = self.prefix + key
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=full_key)
+            # Close the body even if read() fails so the pooled connection is released
+            with closing(response['Body']) as body:
+                return body.read()
+        except Exception:
+            return None
+
+    def _fetch_once(self, key: str) -> Optional[bytes]:
+        """
+        Single-flight S3 fetch: concurrent misses on the same key (within one mget or
+        across overlapping mget calls) share one GET instead of each issuing their own.
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            data = self._fetch_s3(key)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
     def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
-        # 1. Write to S3 (Primary)
-        for key, value in key_value_pairs:
-            full_key = self.prefix + key
-            self.client.put_object(Bucket=self.bucket_name, Key=full_key, Body=value)
-            
-            # 2. Update Redis
-            if self.use_redis:
-                try:
-                    self.redis.setex(f"parent_doc:{key}", 86400, value)
-                except Exception as e:
-                    print(f"⚠️ Redis write failed: {e}")
+        # 0. Drop stale L1 entries
+        self._l1_discard(key for key, _ in key_value_pairs)
+        
+        # 1. Write to S3 (Primary) - PUTs in parallel on the store's pool
+        def put(pair):
+            key, value = pair
+            self.client.put_object(Bucket=self.bucket_name, Key=self.prefix + key, Body=value)
+        
+        for _ in self._executor.map(put, key_value_pairs):
+            pass  # Drain so the first failed PUT raises here
+        
+        # 2. Update Redis (one pipelined round-trip)
+        self._redis_setex_many(key_value_pairs)
 
     def mdelete(self, keys: Sequence[str]) -> None:
-        for key in keys:
-            # 1. Delete S3
-            full_key = self.prefix + key
-            self.client.delete_object(Bucket=self.bucket_name, Key=full_key)
-            
-            # 2. Delete Redis
-            if self.use_redis:
-                try:
-                    self.redis.delete(f"parent_doc:{key}")
-                except Exception:
-                    pass
+        keys = list(keys)
+        self._l1_discard(keys)
+        
+        # 1. Delete S3 (DeleteObjects takes up to 1000 keys per call)
+        for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            batch = keys[start:start + S3_DELETE_BATCH_SIZE]
+            response = self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': self.prefix + key} for key in batch], 'Quiet': True}
+            )
+            if response.get('Errors'):
+                first = response['Errors'][0]
+                raise RuntimeError(f"S3 delete failed for {len(response['Errors'])} keys, e.g. {first.get('Key')}: {first.get('Message')}")
+        
+        # 2. Delete Redis (single DEL for all keys)
+        if self.use_redis and keys:
+            try:
+                self.redis.delete(*[f"parent_doc:{key}" for key in keys])
+            except Exception:
+                pass
 
     def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
         # Minimal implementation for listing if needed
@@ -173,7 +464,8 @@ class RetrievalService:
         self.dense_embeddings = self.embedding_service.get_embedding_function()
         
         # 2. Initialize Sparse Embeddings
-        self.sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+        # Tokenizer/stopword files are cached on disk so restarts don't re-download them
+        self.sparse_embeddings = _get_sparse_embeddings(os.getenv("FASTEMBED_CACHE_DIR", "data/cache/fastembed"))
 
         # Qdrant Config
         self.collection_name = config['paths']['vector_store_config']['collection_name']
@@ -183,18 +475,18 @@ class RetrievalService:
         
         # Initialize Cohere Reranker (Multilingual)
         try:
-            self.cohere_client = cohere.Client(api_key=os.getenv("COHERE_API_KEY"))
+            self.cohere_client = _get_cohere_client(os.getenv("COHERE_API_KEY"))
             logger.info("✅ Cohere Multilingual Reranker initialized")
         except Exception as e:
             logger.error(f"❌ Cohere initialization failed: {e}")
             self.cohere_client = None
         
         # Initialize Query Rewriter LLM (Gemini 2.5 Flash)
-        self.rewriter_llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.1, # Low temp for precision
-            google_api_key=os.getenv("GOOGLE_API_KEY")
+        self.rewriter_llm = get_chat_model(
+            "gemini-2.5-flash",
+            0.1 # Low temp for precision
         )
+        self._rewrite_chain = PromptTemplate.from_template(REWRITE_PROMPT_TEMPLATE) | self.rewriter_llm
 
     def _initialize_components(self):
         """Initializes Qdrant, DocStore, and ParentDocumentRetriever"""
@@ -203,41 +495,10 @@ class RetrievalService:
         try:
             self.client = get_qdrant_client(self.config)
 
-            # A. Child Vector Store (Qdrant)
-            try:
-                exists = self.client.collection_exists(self.collection_name)
-            except Exception:
-                exists = False
-            
-            if not exists:
-                logger.info(f"🆕 Collection {self.collection_name} missing. Creating manually...")
-                try:
-                    self.client.recreate_collection(
-                        collection_name=self.collection_name,
-                        vectors_config=models.VectorParams(size=768, distance=models.Distance.COSINE),
-                        sparse_vectors_config={
-                            "text-sparse": models.SparseVectorParams(
-                                index=models.SparseIndexParams(on_disk=False)
-                            )
-                        }
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to create collection: {e}")
-
-            # Ensure Payload Indexes Exist (Critical for Filtering)
-            try:
-                self.client.create_payload_index(
-                    collection_name=self.collection_name,
-                    field_name="metadata.source",
-                    field_schema=models.PayloadSchemaType.TEXT
-                )
-                self.client.create_payload_index(
-                    collection_name=self.collection_name,
-                    field_name="metadata.page_label",
-                    field_schema=models.PayloadSchemaType.KEYWORD
-                )
-            except Exception:
-                pass # Indices might already exist
+            # A. Child Vector Store (Qdrant) - schema checks once per process and collection
+            if self.collection_name not in _QDRANT_READY:
+                self._prepare_collection()
+                _QDRANT_READY.add(self.collection_name)
 
             # Initialize Store
             try:
@@ -253,12 +514,8 @@ class RetrievalService:
                 print(f"DEBUG: QdrantVectorStore init failed ({e_init}). Forcing Re-Creation.")
                 self.client.recreate_collection(
                         collection_name=self.collection_name,
-                        vectors_config=models.VectorParams(size=768, distance=models.Distance.COSINE),
-                        sparse_vectors_config={
-                            "text-sparse": models.SparseVectorParams(
-                                index=models.SparseIndexParams(on_disk=False)
-                            )
-                        }
+                        vectors_config=VECTORS_CONFIG,
+                        sparse_vectors_config=SPARSE_VECTORS_CONFIG
                 )
                 self.vector_store = QdrantVectorStore(
                     client=self.client,
@@ -270,42 +527,22 @@ class RetrievalService:
                 )
             
             # B. Parent Document Store (S3 Backed)
-            bucket_name = os.getenv("S3_BUCKET_NAME", "neel-rag-data-2026")
-            prefix = "parent_store/"
+            bucket_name = _parent_store_bucket()
+            prefix = PARENT_STORE_PREFIX
             
             try:
-                from botocore.config import Config
-                
-                s3_config = Config(
-                    max_pool_connections=50,
-                    retries={'max_attempts': 3}
-                )
-
-                s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-                    region_name=os.getenv("AWS_REGION", "us-east-1"),
-                    config=s3_config
-                )
-                
-                self.s3_store = S3Store(client=s3_client, bucket_name=bucket_name, prefix=prefix)
+                self.s3_store = S3Store(client=_get_s3_client(), bucket_name=bucket_name, prefix=prefix)
                 logger.info(f"☁️  Connected to S3 DocStore: {bucket_name}/{prefix}")
             except Exception as e_s3:
                 logger.error(f"❌ Failed to connect to S3: {e_s3}")
                 raise e_s3
             
             # Correct Argument Names for this version of LangChain
-            def pickle_encoder(obj):
-                return pickle.dumps(obj)
-            def pickle_decoder(data):
-                return pickle.loads(data) if data else None
-
             self.docstore = EncoderBackedStore(
                 store=self.s3_store,
                 key_encoder=lambda x: x,
-                value_serializer=pickle_encoder,
-                value_deserializer=pickle_decoder
+                value_serializer=_encode_parent,
+                value_deserializer=_decode_parent
             )
             
             # C. Child Splitter
@@ -331,23 +568,83 @@ class RetrievalService:
             print(msg)
             self.retriever = None
 
+    def _prepare_collection(self):
+        """Creates the collection if missing, upgrades its sparse config and payload indexes."""
+        try:
+            info = self.client.get_collection(self.collection_name)  # Doubles as the existence check
+        except Exception:
+            info = None
+        
+        if info is None:
+            logger.info(f"🆕 Collection {self.collection_name} missing. Creating manually...")
+            try:
+                self.client.recreate_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=VECTORS_CONFIG,
+                    sparse_vectors_config=SPARSE_VECTORS_CONFIG
+                )
+            except Exception as e:
+                logger.error(f"Failed to create collection: {e}")
+        else:
+            self._ensure_sparse_idf(info)
+
+        # Ensure Payload Indexes Exist (Critical for Filtering)
+        existing = set(info.payload_schema or {}) if info is not None else set()
+        for field_name, field_schema in (
+            ("metadata.source", models.PayloadSchemaType.TEXT),
+            ("metadata.page_label", models.PayloadSchemaType.KEYWORD),
+        ):
+            if field_name in existing:
+                continue
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
+            except Exception:
+                pass # Index might already exist
+
+    def _ensure_sparse_idf(self, info):
+        """Turns on the IDF modifier for collections created before it was part of the schema."""
+        try:
+            params = info.config.params
+            sparse = (params.sparse_vectors or {}).get("text-sparse")
+            if sparse is not None and sparse.modifier != models.Modifier.IDF:
+                self.client.update_collection(
+                    collection_name=self.collection_name,
+                    sparse_vectors_config={"text-sparse": models.SparseVectorParams(modifier=models.Modifier.IDF)},
+                )
+                logger.info("🔧 Enabled IDF modifier on sparse vectors")
+        except Exception as e:
+            logger.warning(f"Could not enable sparse IDF modifier: {e}")
+
     def delete_documents_by_source(self, source_filename: str):
         """Deletes all documents (Parent & Child) associated with a specific source filename."""
+        self.delete_documents_by_sources([source_filename])
+
+    def delete_documents_by_sources(self, source_filenames):
+        """Deletes the child vectors of several source files with a single Qdrant delete request."""
+        source_filenames = list(source_filenames)
+        if not source_filenames:
+            return
+        label = source_filenames[0] if len(source_filenames) == 1 else f"{len(source_filenames)} sources"
         try:
             from qdrant_client.http import models as rest_models
             
-            logger.info(f"🗑️  Cleaning up existing vectors for: {source_filename}")
+            logger.info(f"🗑️  Cleaning up existing vectors for: {label}")
             
-            # Delete from Qdrant (Child Chunks)
+            # Delete from Qdrant (Child Chunks) - any of the sources matches
             self.client.delete(
                 collection_name=self.collection_name,
                 points_selector=rest_models.FilterSelector(
                     filter=rest_models.Filter(
-                        must=[
+                        should=[
                             rest_models.FieldCondition(
                                 key="metadata.source",
                                 match=rest_models.MatchText(text=source_filename)
                             )
+                            for source_filename in source_filenames
                         ]
                     )
                 )
@@ -358,10 +655,10 @@ class RetrievalService:
             # Since we generate new chunks/ids loosely, old S3 parent docs might be orphaned.
             # For now, vector cleanup is the critical part to prevent duplicate search results.
             
-            logger.info(f"✅ Cleanup Complete for {source_filename}")
+            logger.info(f"✅ Cleanup Complete for {label}")
             
         except Exception as e:
-            logger.error(f"Failed to delete existing documents for {source_filename}: {e}")
+            logger.error(f"Failed to delete existing documents for {label}: {e}")
 
     def add_documents(self, documents):
         """Adds 'Parent' documents. The Retriever will auto-split them into Children."""
@@ -375,7 +672,7 @@ class RetrievalService:
                 self._initialize_components()
             
             if self.retriever:
-                self.retriever.add_documents(documents)
+                self._index_parents(documents)
                 logger.info("✅ Indexing Complete.")
             else:
                 logger.error("❌ Failed to initialize retriever for ingestion.")
@@ -384,6 +681,84 @@ class RetrievalService:
             import traceback
             traceback.print_exc()
 
+    def _index_parents(self, documents):
+        """
+        Same layout as ParentDocumentRetriever.add_documents (children carry the parent's
+        doc_id, parents go to the docstore), but all children are embedded in one batched
+        pass and upserted straight through the Qdrant client in retrieval.upsert_batch_size groups.
+        """
+        id_key = self.retriever.id_key
+        parents = []
+        children = []
+        for doc in documents:
+            doc_id = str(uuid.uuid4())
+            for child in self.child_splitter.split_documents([doc]):
+                child.metadata[id_key] = doc_id
+                children.append(child)
+            parents.append((doc_id, doc))
+        
+        texts = [child.page_content for child in children]
+        # Full-size requests regardless of how many chunks each file produced; a retried
+        # rate limit only repeats its own slice, not the whole batch. Large documents send
+        # several slices concurrently (sparse BM25 runs locally in the meantime).
+        embedding_config = self.config.get('embedding', {})
+        batch_size = embedding_config.get('batch_size', EMBED_BATCH_SIZE)
+        slices = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        embed_slice = partial(self.dense_embeddings.embed_documents, batch_size=batch_size)
+        workers = min(len(slices), embedding_config.get('max_concurrency', EMBED_CONCURRENCY))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+                dense_futures = [pool.submit(embed_slice, chunk) for chunk in slices]
+                sparse_vectors = self.sparse_embeddings.embed_documents(texts)
+                dense_vectors = [vector for future in dense_futures for vector in future.result()]
+        else:
+            dense_vectors = [vector for chunk in slices for vector in embed_slice(chunk)]
+            sparse_vectors = self.sparse_embeddings.embed_documents(texts)
+        
+        points = (
+            models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector={
+                    "": dense,
+                    "text-sparse": models.SparseVector(indices=sparse.indices, values=sparse.values),
+                },
+                payload={"page_content": child.page_content, "metadata": child.metadata},
+            )
+            for child, dense, sparse in zip(children, dense_vectors, sparse_vectors)
+        )
+        self.client.upload_points(
+            collection_name=self.collection_name,
+            points=points,
+            batch_size=self.config.get('retrieval', {}).get('upsert_batch_size', UPSERT_BATCH_SIZE),
+            wait=True,
+        )
+        self.docstore.mset(parents)
+        logger.info(f"🧩 Upserted {len(children)} child chunks for {len(parents)} parents")
+
+    def _rewrite_cache(self):
+        store = getattr(self, "s3_store", None)
+        return store.redis if store is not None and store.use_redis else None
+
+    def _cached_rewrite(self, cache_key):
+        redis_client = self._rewrite_cache()
+        if redis_client is None:
+            return None
+        try:
+            data = redis_client.get(cache_key)
+            return orjson.loads(data) if data else None
+        except Exception as e:
+            logger.warning(f"Rewrite cache read failed: {e}")
+            return None
+
+    def _store_rewrite(self, cache_key, rewritten):
+        redis_client = self._rewrite_cache()
+        if redis_client is None:
+            return
+        try:
+            redis_client.setex(cache_key, REWRITE_CACHE_TTL, orjson.dumps(rewritten))
+        except Exception as e:
+            logger.warning(f"Rewrite cache write failed: {e}")
+
     def rewrite_query(self, query: str, chat_history: list = None) -> dict:
         """Refines the user query (Contextualized by History) and extracts filters."""
         try:
@@ -396,50 +771,178 @@ class RetrievalService:
                     role = "User" if msg.type == "human" else "Assistant"
                     history_str += f"{role}: {msg.content}\n"
             
-            prompt_template = """You are an expert RAG query processor. 
-                Your goal is to REWRITE the user's query into a STANDALONE technical query that effectively searches a Vector Database.
-
-                **PHASE 1: CONTEXT RESOLUTION (CRITICAL)**
-                - Use the CHAT HISTORY to resolve pronouns (e.g., "it", "this", "that report", "the previous answer").
-                - If the user asks "How did you conclude this?" or "Why?", you MUST rewrite it to: "Reasoning for [Specific Claim from previous Assistant Answer]".
-                - Example:
-                    History: (Assistant: The noise limit is 45 dB.)
-                    User: "Where is this mentioned?"
-                    Rewritten: "Source of 45 dB noise limit in the documents"
-
-                **PHASE 2: TRANSLATION & EXPANSION**
-                - The documents are Multilingual (Swedish/German/English). 
-                - Translate KEY technical terms into ALL 3 languages using OR logic.
-                - Example: "Noise" -> "Noise OR buller OR Lärm"
-
-                **PHASE 3: METADATA EXTRACTION**
-                - If a specific filename is mentioned (e.g. "Nordborg"), extract it as a filter.
-                
-                **Rules:**
-                - Return strictly JSON: {{"query": "final rewritten text", "filter": {{"key": "value"}} or null}}
-                - Do NOT answer the question. Just rewrite.
-                
-                Chat History:
-                {history}
-                
-                Current User Query: {query}
-                JSON Output:"""
+            # Repeated query + same recent history -> reuse the previous rewrite
+            cache_key = REWRITE_CACHE_PREFIX + hashlib.blake2b(
+                f"{REWRITE_PROMPT_TEMPLATE}|{query}|{history_str}".encode("utf-8"), digest_size=16
+            ).hexdigest()
+            cached = self._cached_rewrite(cache_key)
+            if cached is not None:
+                logger.info("♻️  Query rewrite served from cache")
+                return cached
             
-            prompt = PromptTemplate.from_template(prompt_template)
-            chain = prompt | self.rewriter_llm
-            result = chain.invoke({"query": query, "history": history_str})
+            result = self._rewrite_chain.invoke({"query": query, "history": history_str})
             
             # Clean and parse JSON
             content = result.content.strip()
             if "```json" in content:
                 content = content.replace("```json", "").replace("```", "")
             
-            import json
-            return json.loads(content)
+            rewritten = orjson.loads(content)
+            self._store_rewrite(cache_key, rewritten)
+            return rewritten
         except Exception as e:
             logger.warning(f"Query processing failed: {e}. Using original query.")
             return {"query": query, "filter": None}
 
+    def _rerank(self, query, docs, top_k):
+        """
+        Reranks parent documents with Cohere and returns the top_k in relevance order.
+        Scores of (query, passage) pairs seen before come from _RERANK_CACHE; only unseen
+        passages are sent to Cohere.
+        """
+        if len(docs) <= 1:
+            return list(docs)  # Nothing to reorder - skip the API call
+        
+        model = self.config['retrieval'].get('rerank_model', RERANK_MODEL)
+        max_chars = self.config['retrieval'].get('rerank_max_chars')
+        query_key = _text_key(f"{model}\x00{max_chars}\x00{query}")
+        keys = [(query_key, _passage_key(doc)) for doc in docs]
+        with _RERANK_CACHE_LOCK:
+            scores = [_RERANK_CACHE.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    _RERANK_CACHE.move_to_end(key)
+        
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            rerank_response = self.cohere_client.rerank(
+                model=model,
+                query=query,  # Use ORIGINAL query, not rewritten (Cohere handles multilingual)
+                documents=[docs[i].page_content[:max_chars] for i in missing],  # [:None] = full text
+                top_n=len(missing),  # Need every score to merge with cached ones
+                return_documents=False  # We already have the docs
+            )
+            with _RERANK_CACHE_LOCK:
+                for result in rerank_response.results:
+                    i = missing[result.index]
+                    scores[i] = result.relevance_score
+                    _RERANK_CACHE[keys[i]] = result.relevance_score
+                while len(_RERANK_CACHE) > RERANK_CACHE_SIZE:
+                    _RERANK_CACHE.popitem(last=False)
+        else:
+            logger.info(f"♻️  All {len(docs)} rerank scores served from cache")
+        
+        ranked = sorted((i for i, score in enumerate(scores) if score is not None),
+                        key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in ranked[:top_k]]
+
+    def _query_vectors(self, queries):
+        """
+        (dense, sparse) query vectors, memoized per query text in _QUERY_VECTOR_CACHE.
+        Repeated queries (and rewrites served from the rewrite cache) skip both the Gemini
+        embedding call and FastEmbed tokenization; misses are embedded in one dense batch.
+        """
+        model = self.config['embedding']['model_name']
+        keys = [(model, q) for q in queries]
+        with _QUERY_VECTOR_CACHE_LOCK:
+            vectors = [_QUERY_VECTOR_CACHE.get(key) for key in keys]
+            for key, vector in zip(keys, vectors):
+                if vector is not None:
+                    _QUERY_VECTOR_CACHE.move_to_end(key)
+        
+        missing = list(dict.fromkeys(q for q, vector in zip(queries, vectors) if vector is None))
+        if missing:
+            fresh = dict(zip(missing, zip(
+                self.dense_embeddings.embed_queries(missing),
+                [self.sparse_embeddings.embed_query(q) for q in missing],  # Local BM25, cheap
+            )))
+            with _QUERY_VECTOR_CACHE_LOCK:
+                for q, vector in fresh.items():
+                    _QUERY_VECTOR_CACHE[(model, q)] = vector
+                while len(_QUERY_VECTOR_CACHE) > QUERY_VECTOR_CACHE_SIZE:
+                    _QUERY_VECTOR_CACHE.popitem(last=False)
+            vectors = [vector or fresh[q] for q, vector in zip(queries, vectors)]
+        
+        return [dense for dense, _ in vectors], [sparse for _, sparse in vectors]
+
+    def _hybrid_parents(self, queries, limit, query_filter=None, dense_vectors=None):
+        """
+        Hybrid child search for several queries with server-side RRF fusion, mapped to parents.
+        Dense query vectors come from one batched embedding call (unless passed in), Qdrant runs
+        every search in a single query_batch_points request and all parents are fetched with
+        one docstore.mget.
+        
+        Returns one list of (parent_document, fused_score) per query, best first; a parent's
+        score is that of its best-ranked child.
+        """
+        id_key = self.retriever.id_key
+        cached_dense, sparse_vectors = self._query_vectors(queries)
+        dense_vectors = dense_vectors or cached_dense
+        
+        requests = [
+            models.QueryRequest(
+                prefetch=[
+                    models.Prefetch(query=dense, filter=query_filter, limit=limit),
+                    models.Prefetch(
+                        query=models.SparseVector(indices=sparse.indices, values=sparse.values),
+                        using="text-sparse",
+                        filter=query_filter,
+                        limit=limit,
+                    ),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                filter=query_filter,
+                limit=limit,
+                with_payload=True,
+            )
+            for dense, sparse in zip(dense_vectors, sparse_vectors)
+        ]
+        responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        
+        # Parent ids per query in child rank order, then a single docstore round-trip
+        scored_ids = []
+        for response in responses:
+            ids = {}
+            for point in response.points:
+                doc_id = (point.payload.get("metadata") or {}).get(id_key)
+                if doc_id and doc_id not in ids:
+                    ids[doc_id] = point.score
+            scored_ids.append(ids)
+        unique_ids = list(dict.fromkeys(doc_id for ids in scored_ids for doc_id in ids))
+        parents_by_id = dict(zip(unique_ids, self.docstore.mget(unique_ids)))
+        return [
+            [(parents_by_id[doc_id], score) for doc_id, score in ids.items() if parents_by_id.get(doc_id) is not None]
+            for ids in scored_ids
+        ]
+
+    def _rerank_margin_met(self, scored, top_k):
+        """True if fusion already separates the top_k clearly enough to skip Cohere (opt-in)."""
+        margin = self.config['retrieval'].get('rerank_skip_margin')
+        if not margin or len(scored) <= top_k:
+            return False
+        return scored[0][1] - scored[top_k][1] >= margin
+
+    def _adopt_speculative(self, speculative, query, refined_query):
+        """
+        Decides whether the original-query results started before the rewrite can stand in for
+        the rewritten query: identical text, or dense embeddings with cosine >= the configured
+        threshold. Returns (scored_parents or None, rewritten query's dense vector list or None).
+        """
+        try:
+            if " ".join(refined_query.lower().split()) == " ".join(query.lower().split()):
+                return speculative.result()[0], None
+            (original_vec, refined_vec), _ = self._query_vectors([query, refined_query])
+            norm = (sum(a * a for a in original_vec) * sum(b * b for b in refined_vec)) ** 0.5
+            similarity = sum(a * b for a, b in zip(original_vec, refined_vec)) / norm if norm else 0.0
+            if similarity >= self.config['retrieval'].get('speculative_min_similarity', 0.9):
+                logger.info(f"⚡ Rewrite close to original (cos={similarity:.3f}), using speculative results")
+                return speculative.result()[0], None
+            speculative.cancel()
+            return None, [refined_vec]
+        except Exception as e:
+            logger.warning(f"Speculative retrieval unusable ({e}), searching with rewritten query")
+            return None, None
+
     def get_relevant_docs(self, query, top_k=10, chat_history=None):
         """Hybrid Retrieval (Child Search -> Parent Fetch) + Reranking Loop"""
         
@@ -455,8 +958,17 @@ class RetrievalService:
             if self.retriever is None:
                 return [], metrics
 
+            candidate_k = self.config['retrieval'].get('candidate_k', 30)
+            
+            # Speculative retrieval on the original query while Gemini rewrites it
+            speculative = None
+            if self.config['retrieval'].get('speculative_retrieval', False):
+                speculative = _RETRIEVAL_EXECUTOR.submit(self._hybrid_parents, [query], candidate_k)
+
             # Step 0: Query Rewriting (The Safety Net)
+            start_rewrite = time.time()
             rewritten_result = self.rewrite_query(query, chat_history) # Returns dict now
+            time_rewrite = time.time() - start_rewrite
             
             refined_query = rewritten_result.get("query", query)
             meta_filter = rewritten_result.get("filter")
@@ -471,7 +983,6 @@ class RetrievalService:
 
             # Step 1: Base Retrieval (Get Parent Documents)
             # Fetch 'candidate_k' (e.g. 30) instead of final 'top_k' (e.g. 5)
-            candidate_k = self.config['retrieval'].get('candidate_k', 30)
             
             # Construct Search Kwargs
             search_kwargs = {"k": candidate_k}
@@ -530,13 +1041,18 @@ class RetrievalService:
                    search_kwargs["filter"] = q_filter
 
             # Step 1: Base Retrieval
-            import time
             start_retrieval = time.time()
             
-            # Forcing k and filter
-            self.retriever.search_kwargs = search_kwargs
-            
-            initial_parents = self.retriever.invoke(refined_query) 
+            # Child search with fusion in Qdrant, then parent fetch
+            scored_parents, dense_vectors = None, None
+            if speculative is not None and "filter" not in search_kwargs:
+                scored_parents, dense_vectors = self._adopt_speculative(speculative, query, refined_query)
+            if scored_parents is None:
+                scored_parents = self._hybrid_parents(
+                    [refined_query], search_kwargs["k"], query_filter=search_kwargs.get("filter"),
+                    dense_vectors=dense_vectors
+                )[0]
+            initial_parents = [doc for doc, _ in scored_parents]
             
             time_retrieval_fetch = time.time() - start_retrieval
             logger.info(f"🔍 Retrieved {len(initial_parents)} Parent Documents in {time_retrieval_fetch:.2f}s")
@@ -552,29 +1068,15 @@ class RetrievalService:
                 logger.warning("⚠️ Cohere not available, using documents as-is")
                 final_docs = initial_parents[:top_k]
                 time_rerank = 0.0
+            elif self._rerank_margin_met(scored_parents, top_k):
+                logger.info(f"⏭️  Fusion scores clearly separate the top {top_k}, skipping Cohere rerank")
+                final_docs = initial_parents[:top_k]
+                time_rerank = 0.0
             else:
                 try:
-                    # Prepare documents for Cohere
-                    doc_texts = [doc.page_content for doc in initial_parents]
-                    
-                    # Call Cohere Rerank API
-                    rerank_response = self.cohere_client.rerank(
-                        model="rerank-multilingual-v3.0",
-                        query=query,  # Use ORIGINAL query, not rewritten (Cohere handles multilingual)
-                        documents=doc_texts,
-                        top_n=top_k,
-                        return_documents=False  # We already have the docs
-                    )
-                    
+                    final_docs = self._rerank(query, initial_parents, top_k)
                     time_rerank = time.time() - start_rerank
                     logger.info(f"⏱️ Cohere Reranking Time: {time_rerank:.2f}s")
-                    
-                    # Map reranked results back to original docs
-                    final_docs = []
-                    for result in rerank_response.results:
-                        original_doc = initial_parents[result.index]
-                        final_docs.append(original_doc)
-                        
                 except Exception as e:
                     logger.error(f"❌ Cohere reranking failed: {e}. Using top candidates.")
                     final_docs = initial_parents[:top_k]
@@ -582,7 +1084,7 @@ class RetrievalService:
             
             # [METRICS]
             metrics = {
-                "rewrite_seconds": 0.0, # Placeholder until we instrument rewrite_query
+                "rewrite_seconds": time_rewrite,
                 "retrieval_seconds": time_retrieval_fetch,
                 "rerank_seconds": time_rerank,
                 "total_seconds": time.time() - start_retrieval
@@ -600,11 +1102,12 @@ class RetrievalService:
         """Clears the collection and docstore"""
         try:
             self.client.delete_collection(self.collection_name)
+            _QDRANT_READY.discard(self.collection_name)
             logger.info(f"Cleared Qdrant collection {self.collection_name}")
             
             # Clear S3 DocStore (Prefix)
-            bucket_name = os.getenv("S3_BUCKET_NAME", "neel-rag-data-2026")
-            prefix = "parent_store/"
+            bucket_name = _parent_store_bucket()
+            prefix = PARENT_STORE_PREFIX
             s3 = boto3.resource('s3')
             bucket = s3.Bucket(bucket_name)
             bucket.objects.filter(Prefix=prefix).delete()
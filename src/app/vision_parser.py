@@ -3,120 +3,61 @@ Vision Parser - Extract structured data from charts/tables using Gemini Vision
 """
 
 import os
+import io
+import re
+import asyncio
 import json
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Dict, Any, Optional, Union
 from pathlib import Path
 import google.generativeai as genai
 from PIL import Image
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, InternalServerError
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    wait_exponential,
+    retry_if_exception_type,
+    before_sleep_log
+)
+
+from src.core.disk_cache import DiskCache
 
 logger = logging.getLogger('app_logger')
 
-class VisionChartParser:
-    """
-    Extract structured data from charts and complex tables using Gemini Vision API
-    """
-    
-    def __init__(self, api_key: Optional[str] = None, model_name: str = "gemini-2.5-flash"):
-        """
-        Initialize Vision Parser
-        
-        Args:
-            api_key: Google API key (defaults to env GOOGLE_API_KEY)
-            model_name: Gemini model to use
-        """
-        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("Google API key required. Set GOOGLE_API_KEY environment variable.")
-        
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel(model_name)
-        self.model_name = model_name
-    
-    def extract_chart_data(
-        self, 
-        image_path: str, 
-        chart_type: str = 'auto',
-        custom_prompt: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """
-        Extract data from chart image
-        
-        Args:
-            image_path: Path to chart image (PNG, JPG)
-            chart_type: 'bar', 'line', 'table', 'mixed', or 'auto'
-            custom_prompt: Optional custom extraction prompt
-        
-        Returns:
-            Dict with 'success', 'data', 'raw_response', 'error' (if failed)
-        """
-        try:
-            # Load image
-            if not Path(image_path).exists():
-                return {
-                    'success': False,
-                    'error': f"Image not found: {image_path}"
-                }
-            
-            image = Image.open(image_path)
-            
-            # Select prompt
-            if custom_prompt:
-                prompt = custom_prompt
-            elif chart_type == 'bar':
-                prompt = self._get_bar_chart_prompt()
-            elif chart_type == 'table':
-                prompt = self._get_table_prompt()
-            else:
-                prompt = self._get_auto_detect_prompt()
-            
-            # Call Gemini Vision
-            logger.info(f"Calling Gemini Vision for {image_path} (type: {chart_type})")
-            response = self.model.generate_content([prompt, image])
-            
-            # Parse response
-            return self._parse_response(response.text)
-            
-        except Exception as e:
-            logger.error(f"Vision extraction failed: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'raw_response': None
-            }
-    
-    def _parse_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse Gemini's response, extracting JSON if present"""
-        try:
-            # Try to extract JSON from response
-            # Gemini often wraps JSON in markdown code blocks
-            if '```json' in response_text:
-                json_str = response_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in response_text:
-                json_str = response_text.split('```')[1].split('```')[0].strip()
-            else:
-                json_str = response_text.strip()
-            
-            # Parse JSON
-            data = json.loads(json_str)
-            
-            return {
-                'success': True,
-                'data': data,
-                'raw_response': response_text
-            }
-        except json.JSONDecodeError as e:
-            # Gemini didn't return valid JSON
-            logger.warning(f"Failed to parse JSON: {e}")
-            return {
-                'success': False,
-                'error': f"Invalid JSON response: {e}",
-                'raw_response': response_text
-            }
-    
-    def _get_bar_chart_prompt(self) -> str:
-        """Prompt optimized for bar charts"""
-        return """You are analyzing a BAR CHART from a technical document.
+# orjson for response parsing / markdown fallback (str in, str out); stdlib json as fallback
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(value, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(value, option=option).decode("utf-8")
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(value, indent=False):
+        return json.dumps(value, indent=2 if indent else None, ensure_ascii=False)
+
+# OpenCV decodes/resizes noticeably faster than Pillow; PIL stays the fallback (and handles
+# formats cv2 can't decode, e.g. GIF)
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
+# Fenced response bodies: a ```json block wins over any other fence; unclosed fences run to the end
+_JSON_FENCE_RE = re.compile(r"```json(.*?)(?:```|\Z)", re.DOTALL)
+_FENCE_RE = re.compile(r"```(.*?)(?:```|\Z)", re.DOTALL)
+
+# Extraction prompts (bar / table / auto-detect)
+_BAR_PROMPT = """You are analyzing a BAR CHART from a technical document.
 
 CRITICAL TASK: Extract EVERY single bar with extreme precision.
 
@@ -155,10 +96,8 @@ EXAMPLE OUTPUT:
 }
 
 Now analyze the provided image and return ONLY the JSON output."""
-    
-    def _get_table_prompt(self) -> str:
-        """Prompt optimized for tables"""
-        return """You are analyzing a TABLE from a technical document.
+
+_TABLE_PROMPT = """You are analyzing a TABLE from a technical document.
 
 CRITICAL TASK: Extract the complete table structure.
 
@@ -192,10 +131,8 @@ EXAMPLE OUTPUT:
 }
 
 Now analyze the provided image and return ONLY the JSON output."""
-    
-    def _get_auto_detect_prompt(self) -> str:
-        """Generic prompt for auto-detection"""
-        return """You are analyzing a technical diagram, chart, or table.
+
+_AUTO_PROMPT = """You are analyzing a technical diagram, chart, or table.
 
 TASK:
 1. Identify the type of visual element (bar chart, line graph, table, mixed, other)
@@ -222,11 +159,339 @@ CRITICAL REQUIREMENTS:
 - Be exhaustive, not selective
 
 Now analyze the provided image and return ONLY the JSON output."""
+
+
+# Gemini JSON mode: the response body is the JSON itself (no markdown fences). Bar charts have a
+# fixed shape and get a schema; table rows are keyed by the detected headers, so tables and
+# auto-detect only request JSON.
+_BAR_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "chart_title": {"type": "string"},
+        "y_axis_label": {"type": "string"},
+        "x_axis_label": {"type": "string"},
+        "bars": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "label": {"type": "string"},
+                    "value": {"type": "number"},
+                    "unit": {"type": "string"}
+                },
+                "required": ["label", "value"]
+            }
+        }
+    },
+    "required": ["bars"]
+}
+_JSON_CONFIG = {"response_mime_type": "application/json"}
+_BAR_JSON_CONFIG = {"response_mime_type": "application/json", "response_schema": _BAR_SCHEMA}
+
+# Gemini calls currently in flight, keyed like the persistent cache
+_VISION_INFLIGHT: Dict[str, Future] = {}
+_VISION_INFLIGHT_LOCK = threading.Lock()
+
+
+# genai.configure mutates process-global client state - only touch it when the key changes
+_GENAI_LOCK = threading.Lock()
+_GENAI_CONFIGURED_KEY: Optional[str] = None
+
+
+def _ensure_configured(api_key: str):
+    global _GENAI_CONFIGURED_KEY
+    if _GENAI_CONFIGURED_KEY == api_key:
+        return
+    with _GENAI_LOCK:
+        if _GENAI_CONFIGURED_KEY != api_key:
+            genai.configure(api_key=api_key)
+            _GENAI_CONFIGURED_KEY = api_key
+
+
+def _warm_up(model):
+    """Cheap count_tokens call so the channel/TLS handshake is done before the first extraction"""
+    try:
+        model.count_tokens("warmup")
+    except Exception as e:
+        logger.debug(f"Gemini vision warmup failed: {e}")
+
+
+@lru_cache(maxsize=4)
+def _get_model(model_name: str):
+    """One GenerativeModel per model name per process instead of one per parser instance"""
+    model = genai.GenerativeModel(model_name)
+    threading.Thread(target=_warm_up, args=(model,), name="vision-warmup", daemon=True).start()
+    return model
+
+class VisionChartParser:
+    """
+    Extract structured data from charts and complex tables using Gemini Vision API
+    """
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model_name: str = "gemini-2.5-flash",
+        max_side: int = 1024,
+        table_max_side: int = 1536,
+        cache_dir: Optional[str] = None
+    ):
+        """
+        Initialize Vision Parser
+        
+        Args:
+            api_key: Google API key (defaults to env GOOGLE_API_KEY)
+            model_name: Gemini model to use
+            max_side: Longest image side sent to Gemini (vision tokens scale with pixel area)
+            table_max_side: Longest side for chart_type='table' (small cell text needs more pixels)
+            cache_dir: Directory for persisted extraction results (defaults to env VISION_CACHE_DIR)
+        """
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not self.api_key:
+            raise ValueError("Google API key required. Set GOOGLE_API_KEY environment variable.")
+        
+        _ensure_configured(self.api_key)
+        self.model = _get_model(model_name)
+        self.model_name = model_name
+        self.max_side = max_side
+        self.table_max_side = table_max_side
+        
+        # Re-ingesting a document (or a duplicate chart) reuses the earlier extraction
+        self.cache_dir = Path(cache_dir or os.getenv('VISION_CACHE_DIR', 'data/cache'))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # SQLite-backed: safe to share between threads and Celery worker processes
+        self._cache = DiskCache(self.cache_dir / 'vision_extract.sqlite')
+    
+    def extract_chart_data(
+        self, 
+        image_path: Union[str, bytes], 
+        chart_type: str = 'auto',
+        custom_prompt: Optional[str] = None,
+        force_refresh: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Extract data from chart image
+        
+        Args:
+            image_path: Path to chart image (PNG, JPG) or raw image bytes
+            chart_type: 'bar', 'line', 'table', 'mixed', or 'auto'
+            custom_prompt: Optional custom extraction prompt
+            force_refresh: Ignore a cached result and call Gemini again
+        
+        Returns:
+            Dict with 'success', 'data', 'raw_response', 'error' (if failed)
+        """
+        try:
+            # Resolve the image source (in-memory bytes skip the disk round-trip)
+            if isinstance(image_path, (bytes, bytearray)):
+                image_source = io.BytesIO(image_path)
+                image_label = f"<{len(image_path)} bytes>"
+            else:
+                if not Path(image_path).exists():
+                    return {
+                        'success': False,
+                        'error': f"Image not found: {image_path}"
+                    }
+                
+                image_source = image_path
+                image_label = image_path
+            
+            # Select prompt
+            if custom_prompt:
+                prompt = custom_prompt
+            elif chart_type == 'bar':
+                prompt = self._get_bar_chart_prompt()
+            elif chart_type == 'table':
+                prompt = self._get_table_prompt()
+            else:
+                prompt = self._get_auto_detect_prompt()
+            
+            # Downscaled JPEG instead of the full-resolution image; the decoded image and its
+            # file handle are released here, before the Gemini round-trip
+            max_side = self.table_max_side if chart_type == 'table' else self.max_side
+            image_part = self._prepare_image_cv2(image_path, max_side) if cv2 is not None else None
+            if image_part is None:
+                with Image.open(image_source) as image:
+                    image.load()
+                    image_part = self._prepare_image(image, max_side)
+            
+            cache_key = self._cache_key(image_part['data'], prompt)
+            if not force_refresh:
+                cached = self._cache_get(cache_key)
+                if cached is not None:
+                    logger.info(f"Vision cache hit for {image_label} (type: {chart_type})")
+                    return cached
+            
+            if custom_prompt:
+                generation_config = None  # caller's prompt decides the output format
+            elif chart_type == 'bar':
+                generation_config = _BAR_JSON_CONFIG
+            else:
+                generation_config = _JSON_CONFIG
+            return self._extract_once(cache_key, [prompt, image_part], generation_config, image_label, chart_type)
+            
+        except Exception as e:
+            logger.error(f"Vision extraction failed: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'raw_response': None
+            }
+    
+    def _extract_once(self, cache_key, contents, generation_config, image_label, chart_type) -> Dict[str, Any]:
+        """
+        Single-flight Gemini call: concurrent requests for the same image+prompt+model (a chart
+        repeated on many pages) share one API call instead of each issuing their own.
+        """
+        with _VISION_INFLIGHT_LOCK:
+            future = _VISION_INFLIGHT.get(cache_key)
+            owner = future is None
+            if owner:
+                future = Future()
+                _VISION_INFLIGHT[cache_key] = future
+        
+        if not owner:
+            logger.info(f"Joining in-flight Gemini Vision call for {image_label} (type: {chart_type})")
+            return future.result()
+        
+        try:
+            # Call Gemini Vision
+            logger.info(f"Calling Gemini Vision for {image_label} (type: {chart_type})")
+            response_text = self._generate(contents, generation_config)
+            
+            # Parse response
+            result = self._parse_response(response_text)
+            if result['success']:
+                self._cache_put(cache_key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _VISION_INFLIGHT_LOCK:
+                _VISION_INFLIGHT.pop(cache_key, None)
+    
+    @staticmethod
+    def _prepare_image(image: Image.Image, max_side: int) -> Dict[str, Any]:
+        """
+        Shrink the image to max_side (aspect preserved, never upscaled) and re-encode as
+        JPEG q85 - an inline part of tens of KB instead of a multi-MB PNG of the original.
+        """
+        image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=85, optimize=True)
+        return {"mime_type": "image/jpeg", "data": buf.getvalue()}
+    
+    @staticmethod
+    def _prepare_image_cv2(image_path: Union[str, bytes], max_side: int) -> Optional[Dict[str, Any]]:
+        """
+        OpenCV version of _prepare_image (INTER_AREA downscale, JPEG q85).
+        Returns None when cv2 can't decode the input so the caller falls back to PIL.
+        """
+        if isinstance(image_path, (bytes, bytearray)):
+            arr = cv2.imdecode(np.frombuffer(image_path, np.uint8), cv2.IMREAD_COLOR)
+        else:
+            arr = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+        if arr is None:
+            return None
+        
+        h, w = arr.shape[:2]
+        scale = min(1.0, max_side / max(h, w))
+        if scale < 1.0:
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            arr = cv2.resize(arr, size, interpolation=cv2.INTER_AREA)
+        
+        ok, buf = cv2.imencode('.jpg', arr, [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+        if not ok:
+            return None
+        return {"mime_type": "image/jpeg", "data": buf.tobytes()}
+    
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=1, min=1, max=32),
+        retry=retry_if_exception_type((ResourceExhausted, ServiceUnavailable, InternalServerError)),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True
+    )
+    def _generate(self, contents, generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Streamed generate_content with backoff on 429/5xx (rate-limit spikes during batch ingestion).
+        Large tables come back as tens of KB of JSON; streaming receives it while the model is
+        still generating instead of waiting for one blocking response. Returns the response text.
+        """
+        response = self.model.generate_content(contents, generation_config=generation_config, stream=True)
+        chunks = []
+        for chunk in response:
+            if chunk.parts:
+                chunks.append(chunk.text)
+        return "".join(chunks)
+    
+    def _cache_key(self, image_bytes: bytes, prompt: str) -> str:
+        """Fingerprint of exactly what Gemini sees: encoded image, prompt and model."""
+        digest = hashlib.blake2b(image_bytes, digest_size=16)
+        digest.update(f"|{self.model_name}|{prompt}".encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._cache.get(key)
+        except Exception as e:
+            logger.debug(f"Vision cache read failed: {e}")
+            return None
+    
+    def _cache_put(self, key: str, result: Dict[str, Any]):
+        try:
+            self._cache.set(key, result)
+        except Exception as e:
+            logger.warning(f"Vision cache write failed: {e}")
+    
+    def _parse_response(self, response_text: str) -> Dict[str, Any]:
+        """Parse Gemini's response, extracting JSON if present"""
+        try:
+            try:
+                # JSON mode responses are the bare JSON document
+                data = _loads(response_text)
+            except json.JSONDecodeError:
+                # Custom prompts (no JSON mode) may still wrap JSON in markdown code blocks
+                match = _JSON_FENCE_RE.search(response_text) or _FENCE_RE.search(response_text)
+                json_str = (match.group(1) if match else response_text).strip()
+                data = _loads(json_str)
+            
+            return {
+                'success': True,
+                'data': data,
+                'raw_response': response_text
+            }
+        except json.JSONDecodeError as e:
+            # Gemini didn't return valid JSON
+            logger.warning(f"Failed to parse JSON: {e}")
+            return {
+                'success': False,
+                'error': f"Invalid JSON response: {e}",
+                'raw_response': response_text
+            }
+    
+    def _get_bar_chart_prompt(self) -> str:
+        """Prompt optimized for bar charts"""
+        return _BAR_PROMPT
+    
+    def _get_table_prompt(self) -> str:
+        """Prompt optimized for tables"""
+        return _TABLE_PROMPT
+    
+    def _get_auto_detect_prompt(self) -> str:
+        """Generic prompt for auto-detection"""
+        return _AUTO_PROMPT
     
     def convert_to_markdown(self, structured_data: Dict) -> str:
         """
         Convert structured data to markdown for storage
         
+        Results are memoized on the JSON encoding of the data, so retries and
+        duplicate charts/tables don't rebuild the same markdown.
+        
         Args:
             structured_data: Parsed JSON from vision extraction
         
@@ -236,47 +501,59 @@ Now analyze the provided image and return ONLY the JSON output."""
         if not structured_data:
             return ""
         
+        try:
+            data_json = _dumps(structured_data)
+        except (TypeError, ValueError):
+            # Not JSON-serializable - skip the cache
+            return self._render_markdown(structured_data)
+        
+        return _convert_to_markdown_cached(data_json)
+    
+    @staticmethod
+    def _render_markdown(structured_data: Dict) -> str:
+        """Builds the markdown for a structured vision result (uncached)"""
+        if not structured_data:
+            return ""
+        
+        parts = []
+        
         # Bar chart → Markdown table
         if 'bars' in structured_data:
             title = structured_data.get('chart_title', 'Chart Data')
-            md = f"### {title}\n\n"
-            md += "| Label | Value |\n"
-            md += "|-------|-------|\n"
+            parts.append(f"### {title}\n\n| Label | Value |\n|-------|-------|\n")
             
             for bar in structured_data.get('bars', []):
-                label = bar.get('label', 'Unknown')
-                value = bar.get('value', '')
-                unit = bar.get('unit', '')
-                md += f"| {label} | {value} {unit} |\n"
-            
-            return md
+                parts.append(f"| {bar.get('label', 'Unknown')} | {bar.get('value', '')} {bar.get('unit', '')} |\n")
         
         # Table → Markdown table
         elif 'headers' in structured_data and 'rows' in structured_data:
             title = structured_data.get('table_title', 'Table Data')
-            md = f"### {title}\n\n"
-            
             headers = structured_data['headers']
-            md += "| " + " | ".join(headers) + " |\n"
-            md += "|" + "|".join(["---"] * len(headers)) + "|\n"
-            
-            for row in structured_data.get('rows', []):
-                values = [str(row.get(h, '')) for h in headers]
-                md += "| " + " | ".join(values) + " |\n"
+            # Normalize every row to its cell strings first (one lookup per cell), then join once
+            cells = [[str(row.get(h, '')) for h in headers] for row in structured_data.get('rows', [])]
+            lines = ["| " + " | ".join(headers) + " |", "|" + "|".join(["---"] * len(headers)) + "|"]
+            lines.extend(["| " + " | ".join(row_cells) + " |" for row_cells in cells])
+            parts.append(f"### {title}\n\n")
+            parts.append("\n".join(lines))
+            parts.append("\n")
             
             if 'footer_notes' in structured_data:
-                md += f"\n*{structured_data['footer_notes']}*\n"
-            
-            return md
+                parts.append(f"\n*{structured_data['footer_notes']}*\n")
         
         # Generic fallback
         else:
             title = structured_data.get('title', 'Data')
-            md = f"### {title}\n\n"
-            md += "```json\n"
-            md += json.dumps(structured_data, indent=2, ensure_ascii=False)
-            md += "\n```\n"
-            return md
+            parts.append(f"### {title}\n\n```json\n")
+            parts.append(_dumps(structured_data, indent=True))
+            parts.append("\n```\n")
+        
+        return "".join(parts)
+
+
+@lru_cache(maxsize=512)
+def _convert_to_markdown_cached(data_json: str) -> str:
+    """Memoized markdown rendering keyed by the JSON-encoded data"""
+    return VisionChartParser._render_markdown(_loads(data_json))
 
 
 # Example usage
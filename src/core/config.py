@@ -3,27 +3,26 @@ Module: Config
 Purpose: Centralized configuration loading.
 """
 import os
+import codecs
+import copy
 import yaml
 import logging
+from functools import lru_cache
 # Custom Robust Loader to handle Windows UTF-16 vs UTF-8 issues
 def load_env_robust(path=".env"):
     if not os.path.exists(path):
         return
     
-    content = None
-    try:
-        # Try UTF-8
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except UnicodeError:
-        try:
-            # Try UTF-16 (Common on Windows PowerShell redirection)
-            with open(path, 'r', encoding='utf-16') as f:
-                content = f.read()
-        except UnicodeError:
-            # Fallback
-             pass
-             
+    # One read; the BOM says how to decode (UTF-16 is common on Windows PowerShell redirection)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        content = raw.decode('utf-16')
+    elif raw.startswith(codecs.BOM_UTF8):
+        content = raw[len(codecs.BOM_UTF8):].decode('utf-8')
+    else:
+        content = raw.decode('utf-8', errors='replace')
+    
     if content:
         # Manual parsing to bypass dotenv's brittle parser
         for line in content.splitlines():
@@ -40,13 +39,82 @@ load_env_robust("config/.env")
 
 logger = logging.getLogger('app_logger')
 
+# libyaml-backed loader when PyYAML was built with it (several times faster than the pure-Python one)
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 def load_config(config_path="config/settings.yaml"):
-    """Loads configuration from YAML file"""
+    """
+    Loads configuration from YAML file (parsed once per file version, then cached).
+    Each call returns its own copy, so a caller mutating it can't change the config
+    other callers in the process see.
+    """
     if not os.path.exists(config_path):
         logger.error(f"Config file not found at {config_path}")
         raise FileNotFoundError(f"Config file not found at {config_path}")
-        
+    
+    return copy.deepcopy(_load_config_cached(config_path, os.path.getmtime(config_path)))
+
+@lru_cache(maxsize=8)
+def _load_config_cached(config_path, mtime):
+    """Keyed on mtime, so an edited settings.yaml is re-read on the next call"""
     with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=_YAML_LOADER)
         logger.info("Configuration loaded successfully.")
         return config
+
+
+# Config handoff to Celery workers: the producer publishes the config once
+# under a content hash and tasks carry only the hash.
+CONFIG_KEY_PREFIX = "cfg:"
+CONFIG_TTL_SECONDS = 24 * 3600
+# Config sections process_document_task needs (DocumentIngestion + RetrievalService)
+TASK_CONFIG_KEYS = ('paths', 'parsing', 'embedding', 'retrieval', 's3')
+_config_cache = {}
+
+# orjson (bytes in/out, sorted keys for a stable hash); stdlib json as fallback
+try:
+    import orjson
+
+    def _dumps_sorted(value):
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS, default=str)
+
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    def _dumps_sorted(value):
+        return json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+
+    _loads = json.loads
+
+
+def _redis_client():
+    import redis
+    return redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+
+def publish_config(config):
+    """Stores config in Redis under its blake2b hash (24h TTL) and returns the hash."""
+    import hashlib
+    payload = _dumps_sorted(config)
+    cfg_hash = hashlib.blake2b(payload, digest_size=16).hexdigest()
+    # Plain SET (not NX): re-publishing an identical config refreshes the TTL, so tasks
+    # queued now never point at a key published a day ago that is about to expire
+    _redis_client().set(f"{CONFIG_KEY_PREFIX}{cfg_hash}", payload, ex=CONFIG_TTL_SECONDS)
+    _config_cache[cfg_hash] = config
+    return cfg_hash
+
+
+def fetch_config(cfg_hash):
+    """
+    Loads a published config by hash (cached per process). If the key has expired, falls
+    back to the task sections of the local settings.yaml instead of failing the task.
+    """
+    if cfg_hash not in _config_cache:
+        payload = _redis_client().get(f"{CONFIG_KEY_PREFIX}{cfg_hash}")
+        if payload is None:
+            logger.warning(f"Config {cfg_hash} not found in Redis (expired?) - using local settings")
+            config = load_config()
+            return {k: config[k] for k in TASK_CONFIG_KEYS if k in config}
+        _config_cache[cfg_hash] = _loads(payload)
+    return _config_cache[cfg_hash]
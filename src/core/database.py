@@ -2,12 +2,27 @@
 Module: Database
 Purpose: SQLAlchemy Database Setup for Chat History (SQLite/Postgres)
 """
-from sqlalchemy import create_engine, Column, String, Text, DateTime, JSON
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Text, DateTime, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
 from datetime import datetime
 import uuid
 import os
+import json
+
+# orjson is 5-10x faster than stdlib json for the chat-message JSON column
+try:
+    import orjson
+
+    def _json_serializer(value):
+        return orjson.dumps(value).decode()
+
+    _json_deserializer = orjson.loads
+except ImportError:
+    _json_serializer = json.dumps
+    _json_deserializer = json.loads
 
 # Production: Use Postgres if available, else fallback to SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./rag_app.db")
@@ -16,10 +31,41 @@ Base = declarative_base()
 
 # Engine Config
 connect_args = {}
+pool_args = {}
 if "sqlite" in DATABASE_URL:
     connect_args["check_same_thread"] = False
+    # Keep pragma-tuned connections open (SQLAlchemy 1.4 defaults file SQLite to NullPool)
+    if ":memory:" not in DATABASE_URL:
+        pool_args = {"poolclass": QueuePool, "pool_size": 10, "max_overflow": 10}
+else:
+    # Server databases: keep connections across tasks/requests, but check them on checkout
+    # and recycle before server-side idle timeouts drop them
+    pool_args = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "pool_pre_ping": True,
+        "pool_recycle": 300,
+    }
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args=connect_args,
+    **pool_args,
+    json_serializer=_json_serializer,
+    json_deserializer=_json_deserializer
+)
+
+if "sqlite" in DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL + synchronous=NORMAL: commits no longer fsync the main DB file every time
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-64000")  # 64 MB page cache per connection
+        cursor.close()
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -29,6 +75,15 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def db_session():
+    """Session scope for non-FastAPI callers: `with db_session() as db:` (always closed once)"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # --- Models ---
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -44,3 +99,63 @@ def init_db():
     # Import all models here so they are registered with Base.metadata
     from src.core.models import FileTracking
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+def _add_missing_columns():
+    """create_all() doesn't alter existing tables - add new nullable columns in place"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                col_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+def insert_missing(db, model, rows, key, batch_size=500):
+    """
+    Bulk INSERT ... ON CONFLICT DO NOTHING (Postgres/SQLite).
+    Rows another writer inserted first are skipped instead of failing the batch.
+    
+    Returns:
+        Set of key values actually inserted by this call
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        db.bulk_insert_mappings(model, rows)
+        return {row[key] for row in rows}
+    
+    column = getattr(model, key)
+    inserted = set()
+    for start in range(0, len(rows), batch_size):
+        stmt = (
+            insert(model)
+            .values(rows[start:start + batch_size])
+            .on_conflict_do_nothing(index_elements=[key])
+            .returning(column)
+        )
+        inserted.update(value for (value,) in db.execute(stmt))
+    return inserted
+
+def upsert(db, model, values, key, update):
+    """
+    Single-statement INSERT ... ON CONFLICT (key) DO UPDATE SET update (Postgres/SQLite).
+    Other dialects fall back to session.merge (SELECT + INSERT/UPDATE).
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        db.merge(model(**{**values, **update}))
+        return
+    
+    stmt = insert(model).values(**values).on_conflict_do_update(index_elements=[key], set_=update)
+    db.execute(stmt)
@@ -0,0 +1,63 @@
+"""
+Module: Disk Cache
+Purpose: Small persistent key-value cache shared by every thread and worker process.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+
+# Writers wait this long for another process's write lock instead of failing
+BUSY_TIMEOUT_SECONDS = 30
+
+
+class DiskCache:
+    """
+    SQLite (WAL mode) key -> pickled value store. Unlike shelve, SQLite locks the file
+    itself, so Celery prefork processes can read and write the same cache concurrently.
+    Each thread (and each forked process) opens its own connection.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+    def _conn(self):
+        # A connection inherited across fork must not be reused - reopen per pid
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT_SECONDS)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys present (one query per 500 keys)."""
+        keys = list(keys)
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self._conn().execute(
+                f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update((k, pickle.loads(v)) for k, v in rows)
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """Writes all items in one transaction."""
+        rows = [(k, pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)) for k, v in items.items()]
+        if not rows:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", rows)
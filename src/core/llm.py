@@ -0,0 +1,29 @@
+"""
+Module: LLM
+Purpose: Process-wide Gemini chat clients, so connections are reused across services.
+"""
+import os
+import logging
+from functools import lru_cache
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+logger = logging.getLogger('app_logger')
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name, temperature, max_tokens=None):
+    """
+    Returns a shared ChatGoogleGenerativeAI per (model, temperature, max_tokens).
+    Services built per request/task reuse the same client and its open connections
+    instead of paying a fresh TLS handshake each time.
+    """
+    logger.info(f"🤖 Creating shared LLM client: {model_name} (temperature={temperature})")
+    kwargs = {}
+    if max_tokens is not None:
+        kwargs["max_tokens"] = max_tokens
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        temperature=temperature,
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        convert_system_message_to_human=False, # Native System Instructions
+        **kwargs
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text
+from sqlalchemy import Column, String, DateTime, Text, BigInteger
 from datetime import datetime
 from src.core.database import Base
 
@@ -10,3 +10,5 @@ class FileTracking(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     error_msg = Column(Text, nullable=True)
+    etag = Column(String, nullable=True) # S3 ETag of the ingested object (change detection)
+    size = Column(BigInteger, nullable=True)
@@ -4,28 +4,41 @@ Purpose: Qdrant Database Connectivity
 """
 import os
 import logging
+from functools import lru_cache
 from qdrant_client import QdrantClient, models
 
 logger = logging.getLogger('app_logger')
 
+GRPC_KEEPALIVE_OPTIONS = {
+    "grpc.keepalive_time_ms": 30000,
+    "grpc.keepalive_timeout_ms": 10000,
+    "grpc.keepalive_permit_without_calls": 1,
+}
+
 def get_qdrant_client(config):
-    """Initializes and returns a QdrantClient"""
-    url = os.getenv("QDRANT_URL", config['paths']['vector_store_config']['url'])
-    collection_name = config['paths']['vector_store_config']['collection_name']
-    
-    logger.info(f"💾 Connecting to Qdrant at {url}")
+    """Initializes and returns a QdrantClient (one per process and connection settings)"""
+    store_config = config['paths']['vector_store_config']
+    url = os.getenv("QDRANT_URL", store_config['url'])
+    prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", str(store_config.get('prefer_grpc', False))).lower() in ("1", "true", "yes")
+    grpc_port = int(store_config.get('grpc_port', 6334))
+    return _connect(url, os.getenv("QDRANT_API_KEY"), prefer_grpc, grpc_port)
+
+@lru_cache(maxsize=4)
+def _connect(url, api_key, prefer_grpc, grpc_port):
+    logger.info(f"💾 Connecting to Qdrant at {url} ({'gRPC' if prefer_grpc else 'HTTP'})")
     
     try:
-        api_key = os.getenv("QDRANT_API_KEY")
-        client = QdrantClient(url=url, api_key=api_key, prefer_grpc=False)
+        # gRPC/protobuf carries vectors far more compactly than REST JSON
+        client = QdrantClient(
+            url=url, api_key=api_key, prefer_grpc=prefer_grpc, grpc_port=grpc_port, timeout=30,
+            # Keepalive pings hold the channel open between ingestion batches / idle periods
+            grpc_options=GRPC_KEEPALIVE_OPTIONS if prefer_grpc else None
+        )
         
         # Test connection
         client.get_collections()
         
         # We removed auto-creation here to allow Hybrid/Sparse collections to be managed by RetrievalService
-            
-        return client
-            
         return client
     except Exception as e:
         logger.error(f"❌ Failed to connect to Qdrant: {e}")
@@ -50,6 +50,18 @@ def get_services():
     query_classifier = QueryClassifier()  
     return config, retrieval_service, generation_service, history_manager, query_classifier
 
+def get_event_loop():
+    """
+    One event loop per browser session, so pooled clients/threads survive across that
+    session's ingestion clicks. Not shared app-wide: two sessions clicking at once would
+    run the same loop from two script threads.
+    """
+    if "event_loop" not in st.session_state:
+        loop = asyncio.new_event_loop()
+        nest_asyncio.apply(loop)
+        st.session_state.event_loop = loop
+    return st.session_state.event_loop
+
 async def run_ingestion(config, retrieval_service):
     with st.spinner("🚀 Analyzing Documents & Processing..."):
         try:
@@ -180,7 +192,9 @@ def main():
                 st.error(f"DB Error: {e}")
 
             if st.button("🔄 Trigger Re-Ingestion", type="primary"):
-                asyncio.run(run_ingestion(config, retrieval_service))
+                loop = get_event_loop()
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(run_ingestion(config, retrieval_service))
             
             key = os.getenv("GOOGLE_API_KEY", "")
             if key.startswith("AIza"):
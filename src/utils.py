@@ -1,22 +1,68 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
 import os
 
+LOG_MAX_BYTES = 10_000_000
+LOG_BACKUP_COUNT = 5
+
+
+class _PipeQueueHandler(logging.handlers.QueueHandler):
+    # SimpleQueue.put writes straight to the pipe (no feeder thread), so a record is
+    # never lost when a prefork child exits right after logging it
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+class _PipeQueueListener(logging.handlers.QueueListener):
+    def dequeue(self, block):
+        return self.queue.get()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+# One rotating file handler per log file, owned by a listener thread in the process
+# that first set it up. Several named loggers share app.log, and processes forked
+# afterwards (Celery prefork children) inherit the queue handler, so only that one
+# process ever writes or rotates the file.
+_file_handlers = {}
+
+def _queued_file_handler(log_file, formatter):
+    if log_file not in _file_handlers:
+        rotating = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+        rotating.setFormatter(formatter)
+        log_queue = multiprocessing.SimpleQueue()
+        listener = _PipeQueueListener(log_queue, rotating)
+        listener.start()
+        owner = os.getpid()
+        # Drains queued records before exit - in the owner only; a forked child's sentinel
+        # would stop the owner's listener
+        atexit.register(lambda: os.getpid() == owner and listener.stop())
+        _file_handlers[log_file] = _PipeQueueHandler(log_queue)
+    return _file_handlers[log_file]
+
 def setup_logger(name, log_file='logs/app.log', level=logging.INFO):
     """Function to setup as many loggers as you want"""
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+
+    # Streamlit reruns call this again - don't stack another pair of handlers each time
+    if logger.handlers:
+        return logger
+
     formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-    
+
     # Create logs directory if it doesn't exist
     log_dir = os.path.dirname(log_file)
     if log_dir and not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
-    handler = logging.FileHandler(log_file, encoding='utf-8')        
-    handler.setFormatter(formatter)
+    logger.addHandler(_queued_file_handler(log_file, formatter))
 
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
-    
     # Also log to console
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
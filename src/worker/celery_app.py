@@ -1,5 +1,9 @@
 from celery import Celery
+from celery.signals import worker_process_init
+import asyncio
+import gc
 import os
+import threading
 
 # RabbitMQ use nahi kar rahe, Redis use kar rahe hain as Broker and Backend
 # Windows par Redis Docker ke through chalana padega
@@ -18,7 +22,36 @@ app.conf.update(
     task_acks_late=True,
     enable_utc=True, # STRICT UTC to fix drift
     timezone='UTC',
+    task_serializer='msgpack',  # Compact task payloads on the broker
+    accept_content=['msgpack', 'json'],  # Still accept tasks queued before the switch
+    result_serializer='msgpack',  # Progress meta + results in the backend (json results still readable)
+    # Recycle pool processes periodically - PyMuPDF/LlamaParse native memory isn't
+    # always returned to the OS, so long-lived children creep up in RSS
+    worker_max_tasks_per_child=int(os.getenv("CELERY_MAX_TASKS_PER_CHILD", "50")),
 )
 
+
+# Event loop reused by every task run in a worker process (per thread, for -P threads)
+_loops = threading.local()
+
+
+def get_worker_loop():
+    """Returns this worker's persistent event loop, creating it on first use (e.g. -P solo)."""
+    loop = getattr(_loops, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        _loops.loop = loop
+    return loop
+
+
+@worker_process_init.connect
+def _tune_worker_process(**kwargs):
+    # Collect the oldest generation a bit more often: ingestion tasks leave large
+    # cyclic object graphs (parsed documents, chunk lists) behind
+    gc.set_threshold(700, 10, 5)
+    # Build the loop up front instead of in the first task
+    get_worker_loop()
+
 if __name__ == '__main__':
     app.start()
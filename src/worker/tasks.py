@@ -1,18 +1,64 @@
 import asyncio
+import hashlib
+import json
+import time
 from pathlib import Path
 from datetime import datetime
 from celery import Task
+from celery.signals import worker_process_init
 from celery.utils.log import get_task_logger
+from langchain_core.messages import HumanMessage, AIMessage
 
-from src.worker.celery_app import app
+from src.worker.celery_app import app, get_worker_loop
 from src.app.ingestion import DocumentIngestion
 from src.app.retrieval import RetrievalService
-from src.app.generation import GenerationService
-from src.core.database import get_db
+from src.app.generation import GenerationService, ANSWER_SEPARATOR
+from src.core.config import fetch_config, load_config
+from src.core.database import SessionLocal, upsert
 from src.core.models import FileTracking
 
 logger = get_task_logger(__name__)
 
+# Per-process service cache: a warm worker reuses the S3 client, LlamaParse
+# parsers and vector-store clients across tasks instead of rebuilding them.
+_services = {}
+
+
+def _get_services(config, cfg_key):
+    """Returns (DocumentIngestion, RetrievalService) for this config, built once per process."""
+    if cfg_key not in _services:
+        _services.clear()  # Config changed - don't keep stale clients around
+        _services[cfg_key] = (DocumentIngestion(config), RetrievalService(config))
+    return _services[cfg_key]
+
+
+# chat_history role -> LangChain message class (other roles are ignored)
+_MESSAGE_TYPES = {"user": HumanMessage, "assistant": AIMessage}
+
+# Streamed answers: minimum interval between 'partial' meta updates
+PARTIAL_UPDATE_SECONDS = 0.3
+
+# Same idea for query tasks: retrieval/generation clients stay warm across queries
+_query_services = {}
+
+
+def _get_query_services(config):
+    """Returns (RetrievalService, GenerationService) for this config, built once per process."""
+    key = hashlib.blake2b(json.dumps(config, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+    if key not in _query_services:
+        _query_services.clear()
+        _query_services[key] = (RetrievalService(config), GenerationService(config))
+    return _query_services[key]
+
+
+@worker_process_init.connect
+def _warm_query_services(**kwargs):
+    """Build the query services for the default config before the first query arrives."""
+    try:
+        _get_query_services(load_config())
+    except Exception as e:
+        logger.warning(f"Could not pre-warm query services: {e}")
+
 
 @app.task(bind=True)
 def process_query_task(self, query: str, config: dict, top_k: int = 10, chat_history: list = None):
@@ -33,40 +79,33 @@ def process_query_task(self, query: str, config: dict, top_k: int = 10, chat_his
             "metrics": dict
         }
     
-    Progress Stages:
-        0%: Task started
-        30%: Document retrieval complete
-        70%: Reranking complete
-        100%: Answer generation complete
+    Progress Stages (skipped when config['progress_events'] is false):
+        10%: Searching documents
+        70%: Retrieval + reranking complete, answer streaming ('partial')
+        100%: Answer generation complete (task result)
     """
+    # Each update_state is a result-backend write; answer-only clients can turn them off
+    progress_events = config.get('progress_events', True)
+    
+    def report(meta):
+        if progress_events:
+            self.update_state(state='PROCESSING', meta=meta)
+    
     try:
-        import time
-        
-        # Stage 0: Initialize (0%)
-        self.update_state(
-            state='PROCESSING',
-            meta={'progress': 0, 'message': 'Starting query processing...'}
-        )
-        logger.info(f"🔍 Query task started: {query[:50]}...")
+        logger.debug(f"🔍 Query task started: {query[:50]}...")
         
         # Stage 1: Retrieval (0% → 30%)
-        self.update_state(
-            state='PROCESSING',
-            meta={'progress': 10, 'message': 'Searching documents...'}
-        )
+        report({'progress': 10, 'message': 'Searching documents...'})
         
         start_retrieval = time.time()
-        retrieval_service = RetrievalService(config)
+        retrieval_service, generation_service = _get_query_services(config)
         
         # Convert chat_history to proper format if needed
-        from langchain_core.messages import HumanMessage, AIMessage
-        lc_history = []
-        if chat_history:
-            for msg in chat_history:
-                if msg.get("role") == "user":
-                    lc_history.append(HumanMessage(content=msg["content"]))
-                elif msg.get("role") == "assistant":
-                    lc_history.append(AIMessage(content=msg["content"]))
+        lc_history = [
+            _MESSAGE_TYPES[msg["role"]](content=msg["content"])
+            for msg in chat_history or ()
+            if msg.get("role") in _MESSAGE_TYPES
+        ]
         
         docs, metrics = retrieval_service.get_relevant_docs(
             query=query,
@@ -76,51 +115,49 @@ def process_query_task(self, query: str, config: dict, top_k: int = 10, chat_his
         retrieval_time = time.time() - start_retrieval
         
         if not docs:
-            self.update_state(
-                state='FAILURE',
-                meta={'progress': 100, 'error': 'No relevant documents found'}
-            )
+            # The returned dict is the task result (the API maps 'error' to FAILURE)
             return {
                 "error": "NO_DOCUMENTS_FOUND",
                 "message": "No relevant information found for your query"
             }
         
-        # Stage 2: Reranking complete (30% → 70%)
-        self.update_state(
-            state='PROCESSING',
-            meta={'progress': 30, 'message': 'Documents retrieved. Analyzing...'}
-        )
-        
-        # Simulate reranking progress (already done in retrieval_service)
-        time.sleep(0.5)  # Small delay for smoother UX
-        
-        self.update_state(
-            state='PROCESSING',
-            meta={'progress': 70, 'message': 'Generating answer...'}
-        )
+        # Stage 2: Retrieval + reranking done (one update; reranking happens inside retrieval_service)
+        report({'progress': 70, 'message': 'Generating answer...'})
         
         # Stage 3: Generation (70% → 100%)
         start_generation = time.time()
-        generation_service = GenerationService(config)
         
-        answer = generation_service.generate_answer(
-            query=query,
-            retrieved_docs=docs,
-            chat_history=lc_history if lc_history else None
-        )
+        # Stream the answer; pollers see the text so far as it arrives (meta 'partial',
+        # throttled so Redis isn't written per token). If the model emits ANSWER_SEPARATOR,
+        # only the text after it is shown from then on.
+        answer_parts = []
+        last_update = start_generation
+        for text in generation_service.stream_answer(query, docs, lc_history):
+            answer_parts.append(text)
+            now = time.time()
+            if now - last_update >= PARTIAL_UPDATE_SECONDS:
+                partial = "".join(answer_parts)
+                if ANSWER_SEPARATOR in partial:
+                    partial = partial.split(ANSWER_SEPARATOR, 1)[1].lstrip()
+                report({'progress': 70, 'message': 'Generating answer...', 'partial': partial})
+                last_update = now
+        
+        # Same separator handling as GenerationService.generate_answer
+        answer = "".join(answer_parts)
+        if ANSWER_SEPARATOR in answer:
+            answer = answer.split(ANSWER_SEPARATOR)[1].strip()
         generation_time = time.time() - start_generation
         
-        # Extract sources
+        # Extract sources (first occurrence per document wins; dict keeps insertion order)
         sources = []
-        seen_sources = set()
-        for doc in docs:
-            source_name = doc.metadata.get('source', 'Unknown')
-            if source_name not in seen_sources:
-                sources.append({
-                    'document': source_name,
-                    'page': doc.metadata.get('page_label')
-                })
-                seen_sources.add(source_name)
+        if config.get('return_sources', True):
+            first_seen = {}
+            for doc in docs:
+                metadata = doc.metadata
+                source_name = metadata.get('source', 'Unknown')
+                if source_name not in first_seen:
+                    first_seen[source_name] = {'document': source_name, 'page': metadata.get('page_label')}
+            sources = list(first_seen.values())
         
         # Stage 4: Complete (100%)
         result = {
@@ -134,11 +171,7 @@ def process_query_task(self, query: str, config: dict, top_k: int = 10, chat_his
             }
         }
         
-        self.update_state(
-            state='SUCCESS',
-            meta={'progress': 100, 'message': 'Complete!', 'result': result}
-        )
-        
+        # Celery stores the return value as the SUCCESS result - no separate state write
         logger.info(f"✅ Query completed in {result['metrics']['total_time']:.2f}s")
         return result
         
@@ -151,6 +184,17 @@ def process_query_task(self, query: str, config: dict, top_k: int = 10, chat_his
         raise
 
 
+_UNSET = object()
+
+
+def _set_tracking(db, filename, status, error_msg=_UNSET):
+    """Status transition as a single UPDATE by primary key (no SELECT of the row first)."""
+    values = {FileTracking.status: status, FileTracking.updated_at: datetime.utcnow()}
+    if error_msg is not _UNSET:
+        values[FileTracking.error_msg] = error_msg
+    db.query(FileTracking).filter(FileTracking.filename == filename).update(values, synchronize_session=False)
+
+
 # Custom Retry Task with exponential backoff
 class RetryableIngestionTask(Task):
     """
@@ -178,56 +222,55 @@ def process_document_task(self, file_path_str: str, config: dict):
     Args:
         self: Task instance (bind=True gives access)
         file_path_str: Path to PDF file
-        config: Configuration dict
+        config: Configuration dict, or the hash it was published under
     """
-    db = next(get_db())
+    db = SessionLocal()  # Pooled connection; closed in finally
     filename = Path(file_path_str).name
     retry_count = self.request.retries  # 0, 1, 2, or 3
     
     try:
         # Timing metrics
-        import time
         task_start = time.time()
         
+        # Resolved inside the try so a Redis error is tracked and retried like any other
+        if isinstance(config, str):
+            cfg_key = config
+            config = fetch_config(config)
+        else:
+            cfg_key = json.dumps(config, sort_keys=True, default=str)
+        
         logger.info(f"{'🔄 RETRY' if retry_count > 0 else '🚀 START'} Task: {filename} (Attempt {retry_count + 1}/4)")
         
-        # Get or create tracking record
-        tracking = db.query(FileTracking).filter(FileTracking.filename == filename).first()
-        if not tracking:
-            tracking = FileTracking(filename=filename, status="PROCESSING")
-            db.add(tracking)
-        else:
-            # Update status with retry info
-            if retry_count > 0:
-                tracking.status = f"RETRY_{retry_count}"
-                logger.warning(f"⚠️ Retry attempt {retry_count}/3 for {filename}")
-            else:
-                tracking.status = "PROCESSING"
-            
-            tracking.error_msg = None  # Clear previous errors
-            
-        tracking.updated_at = datetime.utcnow()
+        # Claim the tracking record: one INSERT ... ON CONFLICT DO UPDATE (no SELECT first)
+        if retry_count > 0:
+            logger.warning(f"⚠️ Retry attempt {retry_count}/3 for {filename}")
+        now = datetime.utcnow()
+        upsert(
+            db, FileTracking,
+            {'filename': filename, 'status': "PROCESSING", 'created_at': now, 'updated_at': now},
+            key='filename',
+            update={
+                'status': f"RETRY_{retry_count}" if retry_count > 0 else "PROCESSING",
+                'error_msg': None,  # Clear previous errors
+                'updated_at': now
+            }
+        )
         db.commit()
         
         # 1. Parsing
-        ingestor = DocumentIngestion(config)
+        ingestor, retriever = _get_services(config, cfg_key)
         
         try:
-            # Create isolated event loop for async operations
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            chunks = loop.run_until_complete(
+            # Worker-scoped event loop (created once per process, not per task)
+            chunks = get_worker_loop().run_until_complete(
                 ingestor.process_file(Path(file_path_str), check_processed=False)
             )
-            loop.close()
         except Exception as e:
             logger.error(f"Parsing error: {e}")
             raise e  # Re-raise to trigger retry
               
         # 2. Embedding & Indexing
         if chunks:
-            retriever = RetrievalService(config)
-            
             # ATOMIC: Vector operations and DB update
             try:
                 # Delete existing vectors first
@@ -237,10 +280,12 @@ def process_document_task(self, file_path_str: str, config: dict):
                 retriever.add_documents(chunks)
                 
                 # Mark COMPLETED only after successful vector storage
-                tracking.status = "COMPLETED"
-                tracking.updated_at = datetime.utcnow()
+                _set_tracking(db, filename, "COMPLETED")
                 db.commit()
                 
+                if config.get('s3', {}).get('tag_ingested', False):
+                    ingestor.tag_ingested(file_path_str)
+                
                 # Log success with timing
                 task_duration = time.time() - task_start
                 logger.info(f"✅ SUCCESS: {filename} processed in {task_duration:.2f}s (after {retry_count} retries)")
@@ -252,9 +297,11 @@ def process_document_task(self, file_path_str: str, config: dict):
                 db.rollback()
                 
                 # Update tracking
-                tracking.status = "FAILED" if self.request.retries >= 3 else f"RETRY_{retry_count + 1}"
-                tracking.error_msg = f"Vector storage error: {str(e_vector)}"
-                tracking.updated_at = datetime.utcnow()
+                _set_tracking(
+                    db, filename,
+                    "FAILED" if self.request.retries >= 3 else f"RETRY_{retry_count + 1}",
+                    error_msg=f"Vector storage error: {str(e_vector)}"
+                )
                 db.commit()
                 
                 raise e_vector  # Re-raise to trigger retry
@@ -270,22 +317,17 @@ def process_document_task(self, file_path_str: str, config: dict):
         
         # Update tracking
         try:
-            tracking = db.query(FileTracking).filter(FileTracking.filename == filename).first()
-            if tracking:
-                # Check if max retries exhausted
-                if self.request.retries >= 3:
-                    # Final failure
-                    tracking.status = "FAILED"
-                    tracking.error_msg = str(exc)[:500]  # Truncate long errors
-                    logger.error(f"🔴 FINAL FAILURE for {filename} after 3 retries")
-                else:
-                    # Will retry
-                    tracking.status = f"RETRY_{retry_count + 1}"
-                    next_wait = 5 * (2 ** retry_count)  # Exponential backoff
-                    logger.warning(f"⏳ Will retry {filename} in ~{next_wait}s")
-                
-                tracking.updated_at = datetime.utcnow()
-                db.commit()
+            # Check if max retries exhausted
+            if self.request.retries >= 3:
+                # Final failure
+                _set_tracking(db, filename, "FAILED", error_msg=str(exc)[:500])  # Truncate long errors
+                logger.error(f"🔴 FINAL FAILURE for {filename} after 3 retries")
+            else:
+                # Will retry
+                _set_tracking(db, filename, f"RETRY_{retry_count + 1}")
+                next_wait = 5 * (2 ** retry_count)  # Exponential backoff
+                logger.warning(f"⏳ Will retry {filename} in ~{next_wait}s")
+            db.commit()
         except Exception as e_tracking:
             logger.error(f"Failed to update tracking: {e_tracking}")
             pass
@@ -296,3 +338,106 @@ def process_document_task(self, file_path_str: str, config: dict):
     finally:
         db.close()
 
+
+
+@app.task(bind=True)
+def process_document_batch_task(self, file_paths: list, config):
+    """
+    Process several documents in one task: services are resolved once, the files are
+    parsed concurrently, all chunks are indexed with a single add_documents call and
+    tracking rows are updated with one commit.
+    
+    Files that fail (or produce no chunks) are handed to process_document_task, which
+    keeps the per-file retry/backoff behaviour.
+    
+    Args:
+        file_paths: Paths/S3 keys of the PDFs
+        config: Configuration dict, or the hash it was published under
+    """
+    task_start = time.time()
+    
+    cfg_ref = config
+    names = {p: Path(p).name for p in file_paths}
+    logger.info(f"🚀 START Batch: {len(file_paths)} files")
+    
+    db = SessionLocal()  # Pooled connection; closed in finally
+    settled = False  # True once the tracking rows hold each file's outcome
+    try:
+        if isinstance(config, str):
+            cfg_key = config
+            config = fetch_config(config)
+        else:
+            cfg_key = json.dumps(config, sort_keys=True, default=str)
+        
+        # Claim every file with one UPDATE (rows were created PENDING by the producer)
+        now = datetime.utcnow()
+        db.query(FileTracking).filter(FileTracking.filename.in_(list(names.values()))).update(
+            {FileTracking.status: "PROCESSING", FileTracking.error_msg: None, FileTracking.updated_at: now},
+            synchronize_session=False
+        )
+        db.commit()
+        
+        # 1. Parsing - DocumentIngestion.process_files bounds the concurrency; each
+        # file's chunks are collected as it finishes
+        ingestor, retriever = _get_services(config, cfg_key)
+        parsed = {}
+        get_worker_loop().run_until_complete(ingestor.process_files(
+            file_paths, check_processed=False,
+            on_chunks=parsed.__setitem__  # parsed[path] = chunks
+        ))
+        # process_files logs each failure; files that failed or produced no chunks are re-queued
+        failed = {
+            p: f"Parsing failed or produced no chunks for {names[p]}"
+            for p in file_paths if p not in parsed
+        }
+        
+        # 2. Embedding & Indexing - one add_documents for the whole batch
+        if parsed:
+            retriever.delete_documents_by_sources([names[p] for p in parsed])
+            retriever.add_documents([chunk for chunks in parsed.values() for chunk in chunks])
+            
+            if config.get('s3', {}).get('tag_ingested', False):
+                for path in parsed:
+                    ingestor.tag_ingested(path)
+        
+        # 3. Tracking - one bulk update + commit
+        now = datetime.utcnow()
+        rows = [{'filename': names[p], 'status': "COMPLETED", 'error_msg': None, 'updated_at': now} for p in parsed]
+        rows += [{'filename': names[p], 'status': "PENDING", 'error_msg': err[:500], 'updated_at': now}
+                 for p, err in failed.items()]
+        db.bulk_update_mappings(FileTracking, rows)
+        db.commit()
+        settled = True
+        
+        # Failed files fall back to the single-file task and its retries
+        for path in failed:
+            process_document_task.delay(path, cfg_ref)
+        
+        logger.info(
+            f"✅ Batch done in {time.time() - task_start:.2f}s: "
+            f"{len(parsed)} indexed, {len(failed)} re-queued individually"
+        )
+        return {"completed": [names[p] for p in parsed], "requeued": [names[p] for p in failed]}
+    
+    except Exception as exc:
+        logger.error(f"❌ Batch task error: {exc}")
+        db.rollback()
+        if not settled:
+            # The batch task has no retry policy - release the claimed rows and hand every
+            # file to process_document_task so none is left stuck in PROCESSING
+            try:
+                db.query(FileTracking).filter(FileTracking.filename.in_(list(names.values()))).update(
+                    {FileTracking.status: "PENDING", FileTracking.error_msg: f"Batch error: {str(exc)[:480]}",
+                     FileTracking.updated_at: datetime.utcnow()},
+                    synchronize_session=False
+                )
+                db.commit()
+            except Exception as e_tracking:
+                logger.error(f"Failed to reset tracking: {e_tracking}")
+                db.rollback()
+            for path in file_paths:
+                process_document_task.delay(path, cfg_ref)
+            logger.warning(f"⏳ Re-queued {len(file_paths)} files individually after batch error")
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,28 @@
+import os
+import tempfile
+import unittest
+
+from src.core.config import load_config
+
+
+class LoadConfigTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".yaml")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("embedding:\n  query_batch_wait_ms: 0\nretrieval:\n  top_k: 10\n")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_mutating_result_does_not_leak_into_next_call(self):
+        config = load_config(self.path)
+        config['embedding']['query_batch_wait_ms'] = 10
+        config['retrieval'] = None
+
+        fresh = load_config(self.path)
+        self.assertEqual(fresh['embedding']['query_batch_wait_ms'], 0)
+        self.assertEqual(fresh['retrieval'], {'top_k': 10})
+
+
+if __name__ == "__main__":
+    unittest.main()